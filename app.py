@@ -1,50 +1,63 @@
-from openai import OpenAI
-import os
-import edge_tts
-import json
 import asyncio
-import whisper_timestamped as whisper
-from utility.script.script_generator import generate_script
-from utility.audio.audio_generator import generate_audio
-from utility.captions.timed_captions_generator import generate_timed_captions
-from utility.video.background_video_generator import generate_video_url
-from utility.render.render_engine import get_output_media
-from utility.video.video_search_query_generator import getVideoSearchQueriesTimed, merge_empty_intervals
+from utility.pipeline.orchestrator import generate_video
+from utility.pipeline.batch import BATCH_JOBS, RESOURCE_LIMITS, run_batch
+from utility.render.parallel_render import RENDER_CHUNK_SECONDS, RENDER_WORKERS
+from utility.instrumentation import default_profile_path, enable_cprofile, profile_run
 import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate a video from a topic.")
-    parser.add_argument("topic", type=str, help="The topic for the video")
+    parser.add_argument("topic", type=str, nargs="?", help="The topic for the video")
+    parser.add_argument("--batch", metavar="TOPICS_FILE",
+                        help="Render one video per line of TOPICS_FILE instead of a single topic")
+    parser.add_argument("--batch-dir", default="batch_output",
+                        help="Directory holding the per-job work directories and the resumable batch state")
+    parser.add_argument("--jobs", type=int, default=BATCH_JOBS, help="Batch jobs in flight at once")
+    parser.add_argument("--network-limit", type=int, default=RESOURCE_LIMITS["network"],
+                        help="Concurrent LLM, TTS and Pexels stages across batch jobs")
+    parser.add_argument("--whisper-limit", type=int, default=RESOURCE_LIMITS["whisper"],
+                        help="Concurrent Whisper stages across batch jobs")
+    parser.add_argument("--encode-limit", type=int, default=RESOURCE_LIMITS["encode"],
+                        help="Concurrent renders across batch jobs")
+    parser.add_argument("--tts-captions", action="store_true",
+                        help="Time captions from the TTS word boundaries instead of running Whisper")
+    parser.add_argument("--chunked-whisper", action="store_true",
+                        help="Transcribe long narration as silence-aligned chunks in parallel worker processes")
+    parser.add_argument("--stream-keywords", action="store_true",
+                        help="Stream the keyword LLM answer and start clip search on each segment as it arrives")
+    parser.add_argument("--render-backend", choices=["moviepy", "ffmpeg", "parallel", "incremental"], default="moviepy",
+                        help="Composite frames in MoviePy, compile the render into one ffmpeg filtergraph, "
+                             "encode ffmpeg chunks in parallel and concatenate them, or do the same while "
+                             "reusing chunks that are unchanged since an earlier render")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS,
+                        help="Chunks encoded at the same time with the parallel backend")
+    parser.add_argument("--chunk-seconds", type=float, default=RENDER_CHUNK_SECONDS,
+                        help="Minimum chunk length in seconds with the parallel backend")
+    parser.add_argument("--profile-json", help="Where to write the run profile (default: .logs/run_profiles/)")
+    parser.add_argument("--prometheus", help="Also write the run profile in Prometheus text format to this file")
+    parser.add_argument("--cprofile-dir", help="Write a cProfile dump per stage into this directory")
 
     args = parser.parse_args()
+    if (args.topic is None) == (args.batch is None):
+        parser.error("give either a topic or --batch TOPICS_FILE")
     SAMPLE_TOPIC = args.topic
     SAMPLE_FILE_NAME = "audio_tts.wav"
     VIDEO_SERVER = "pexel"
+    pipeline_options = dict(video_server=VIDEO_SERVER, tts_captions=args.tts_captions,
+                            stream_keywords=args.stream_keywords, chunked_whisper=args.chunked_whisper,
+                            render_backend=args.render_backend, render_workers=args.render_workers,
+                            chunk_seconds=args.chunk_seconds)
 
-    response = generate_script(SAMPLE_TOPIC)
-    print("script: {}".format(response))
+    if args.cprofile_dir:
+        enable_cprofile(args.cprofile_dir)
 
-    asyncio.run(generate_audio(response, SAMPLE_FILE_NAME))
-
-    timed_captions = generate_timed_captions(SAMPLE_FILE_NAME)
-    
-
-    print(timed_captions)
-
-    search_terms = getVideoSearchQueriesTimed(response, timed_captions)
-    print(search_terms)
-
-    background_video_urls = None
-    if search_terms is not None:
-        background_video_urls = generate_video_url(search_terms, VIDEO_SERVER)
-        print(background_video_urls)
-    else:
-        print("No background video")
-
-    background_video_urls = merge_empty_intervals(background_video_urls)
-
-    if background_video_urls is not None:
-        video = get_output_media(SAMPLE_FILE_NAME, timed_captions, background_video_urls, VIDEO_SERVER)
-        print(video)
+    if args.batch:
+        limits = {"network": args.network_limit, "whisper": args.whisper_limit, "encode": args.encode_limit}
+        asyncio.run(run_batch(args.batch, args.batch_dir, jobs=args.jobs, limits=limits, **pipeline_options))
     else:
-        print("No video")
+        # Independent steps (model loading, caption rasterization, clip downloads) overlap with the rest
+        with profile_run(SAMPLE_TOPIC) as profile:
+            video = asyncio.run(generate_video(SAMPLE_TOPIC, audio_file_name=SAMPLE_FILE_NAME, **pipeline_options))
+        print("Run profile: {}".format(profile.write_json(args.profile_json or default_profile_path())))
+        if args.prometheus:
+            profile.write_prometheus(args.prometheus)
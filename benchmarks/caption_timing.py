@@ -0,0 +1,87 @@
+"""
+Benchmark for caption timing on synthetic transcripts of increasing length.
+
+Compares getCaptionsWithTime against the previous dict-scan / list-slicing implementation,
+checks that both produce identical captions, and prints the time per transcript size.
+
+    python -m benchmarks.caption_timing [--sizes 1000 5000 20000]
+"""
+import re
+import time
+import random
+import argparse
+from utility.captions.timed_captions_generator import (getCaptionsWithTime, getTimestampMapping,
+                                                       interpolateTimeFromDict, cleanWord)
+
+VOCABULARY = ("the city skyline at night glows while a lone runner crosses the old bridge "
+              "and rain falls on quiet streets, empty cafes, neon signs; what happens next?").split()
+
+def synthetic_analysis(word_count, seed=0):
+    # roughly 2.5 words per second of narration, split into whisper-sized segments
+    rng = random.Random(seed)
+    words = []
+    t = 0.0
+    for _ in range(word_count):
+        duration = rng.uniform(0.15, 0.6)
+        words.append({"text": rng.choice(VOCABULARY), "start": t, "end": t + duration})
+        t += duration + rng.uniform(0.0, 0.1)
+    segments = [{"words": words[i:i + 30]} for i in range(0, len(words), 30)]
+    return {"text": " ".join(word["text"] for word in words), "segments": segments}
+
+def reference_split(words, maxCaptionSize):
+    halfCaptionSize = maxCaptionSize / 2
+    captions = []
+    while words:
+        caption = words[0]
+        words = words[1:]
+        while words and len(caption + ' ' + words[0]) <= maxCaptionSize:
+            caption += ' ' + words[0]
+            words = words[1:]
+            if len(caption) >= halfCaptionSize and words:
+                break
+        captions.append(caption)
+    return captions
+
+def reference_captions(whisper_analysis, maxCaptionSize=15, considerPunctuation=False):
+    wordLocationToTime = getTimestampMapping(whisper_analysis)
+    position = 0
+    start_time = 0
+    CaptionsPairs = []
+    text = whisper_analysis['text']
+    if considerPunctuation:
+        sentences = re.split(r'(?<=[.!?]) +', text)
+        words = [word for sentence in sentences for word in reference_split(sentence.split(), maxCaptionSize)]
+    else:
+        words = [cleanWord(word) for word in reference_split(text.split(), maxCaptionSize)]
+    for word in words:
+        position += len(word) + 1
+        end_time = interpolateTimeFromDict(position, wordLocationToTime)
+        if end_time and word:
+            CaptionsPairs.append(((start_time, end_time), word))
+            start_time = end_time
+    return CaptionsPairs
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark caption timing across transcript sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000, 20000],
+                        help="Transcript sizes in words (20000 words is roughly two hours of narration)")
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>12} {:>9}".format("words", "reference s", "indexed s", "speedup"))
+    for size in args.sizes:
+        analysis = synthetic_analysis(size)
+        for considerPunctuation in (False, True):
+            expected, reference_time = timed(reference_captions, analysis, considerPunctuation=considerPunctuation)
+            actual, indexed_time = timed(getCaptionsWithTime, analysis, considerPunctuation=considerPunctuation)
+            if actual != expected:
+                raise SystemExit("Caption output differs from the reference at {} words".format(size))
+        print("{:>8} {:>12.4f} {:>12.4f} {:>8.1f}x".format(size, reference_time, indexed_time,
+                                                           reference_time / max(indexed_time, 1e-9)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Import-time budget check for the CLI and the worker process entry points.
+
+Imports each module in a fresh interpreter under `python -X importtime`, takes the best of a
+few runs, and fails when a module takes longer than the budget or pulls in one of the heavy
+libraries that must only load on first use (torch, Whisper, MoviePy, the LLM and TTS SDKs,
+numpy, Pillow, requests). GROQ_API_KEY is removed from the environment, so the check also
+covers importing without API keys configured.
+
+    python -m benchmarks.import_time [--budget-ms 250] [--runs 3] [--modules app ...]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPO_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+
+# the CLI, and the modules spawned render and transcription workers start from
+DEFAULT_MODULES = ["app", "utility.render.parallel_render", "utility.captions.chunked_transcription"]
+
+HEAVY_MODULES = ["torch", "whisper", "whisper_timestamped", "moviepy", "openai", "groq", "edge_tts",
+                 "numpy", "PIL", "requests"]
+
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def measure(module):
+    # (cumulative microseconds of module, {imported name: (self_us, cumulative_us)})
+    env = dict(os.environ)
+    env.pop("GROQ_API_KEY", None)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+                            cwd=REPO_DIRECTORY, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    log = result.stderr.decode(errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError("import {} failed:\n{}".format(module, log[-2000:]))
+    imports = {}
+    for line in log.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            imports[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return imports[module][1], imports
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the CLI and worker entry points.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=250, help="Allowed cumulative import time per module")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per module; the fastest one counts")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list per module")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        # the first run may also compile bytecode, so several runs are taken and the best one kept
+        try:
+            cumulative, imports = min((measure(module) for _ in range(args.runs)), key=lambda run: run[0])
+        except RuntimeError as e:
+            failures.append(str(e))
+            continue
+        print("{:<45} {:>8.1f} ms".format(module, cumulative / 1000))
+        slowest = sorted(((self_us, name) for name, (self_us, _) in imports.items() if name != module), reverse=True)
+        for self_us, name in slowest[:args.top]:
+            print("    {:<41} {:>8.1f} ms self".format(name, self_us / 1000))
+
+        if cumulative / 1000 > args.budget_ms:
+            failures.append("{} took {:.1f} ms to import, budget is {:.0f} ms".format(
+                module, cumulative / 1000, args.budget_ms))
+        heavy = sorted(name for name in HEAVY_MODULES if name in imports)
+        if heavy:
+            failures.append("{} imports {} at load time".format(module, ", ".join(heavy)))
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Offline benchmark of the video pipeline, with local stand-ins for every external service.
+
+The LLM clients in script_generator / video_search_query_generator are replaced by clients that
+replay recorded responses (benchmarks/fixtures/llm_responses.json), Pexels search and clip
+downloads are served by a local HTTP server with synthetic clips, and the narration is a
+synthetic WAV with synthetic word timings, so timings only reflect this repository's code.
+
+For each video length it times caption alignment, script and keyword response handling,
+search resolution, clip downloading (cold cache) and rendering, and stores the results in
+benchmarks/results/ for comparison across commits.
+
+    python -m benchmarks.offline [--lengths 15 30 60] [--backend ffmpeg] [--compare RESULTS_JSON]
+
+Requires ffmpeg (imageio-ffmpeg) and the packages in requirements.txt.
+"""
+import os
+import sys
+import json
+import math
+import time
+import wave
+import struct
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPO_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+FIXTURES_PATH = os.path.join(BENCHMARK_DIRECTORY, "fixtures", "llm_responses.json")
+RESULTS_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "results")
+
+SYNTHETIC_CLIP_COUNT = 4
+SYNTHETIC_CLIP_SECONDS = 12
+SAMPLE_RATE = 24000
+
+class RecordedLLMClient:
+    """
+    Stands in for the OpenAI / Groq client: chat.completions.create replays the recorded
+    responses in order and keeps returning the last one.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        content = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class FakePexelsHandler(BaseHTTPRequestHandler):
+    # set by start_fake_pexels
+    clip_paths = []
+    base_url = ""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/videos/search":
+            query = parse_qs(parsed.query).get("query", [""])[0]
+            self.send_body(json.dumps(self.search_response(query)).encode("utf-8"), "application/json")
+        elif parsed.path.startswith("/clips/"):
+            video_id = int(os.path.basename(parsed.path).split(".")[0])
+            with open(self.clip_paths[video_id % len(self.clip_paths)], "rb") as f:
+                self.send_body(f.read(), "video/mp4")
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def search_response(self, query):
+        # 15 results per query, with ids derived from the query so repeated queries agree
+        seed = int(hashlib.sha256(query.encode("utf-8")).hexdigest()[:8], 16)
+        slug = "-".join(query.lower().split())
+        videos = []
+        for rank in range(15):
+            video_id = seed * 100 + rank
+            videos.append({
+                "id": video_id,
+                "width": 1920,
+                "height": 1080,
+                "duration": 8 + rank % 10,
+                "url": "https://www.pexels.com/video/{}-{}/".format(slug, video_id),
+                "tags": [],
+                "video_files": [{
+                    "id": video_id,
+                    "width": 1920,
+                    "height": 1080,
+                    "link": "{}/clips/{}.hd.mp4".format(self.base_url, video_id),
+                }],
+            })
+        return {"page": 1, "per_page": 15, "total_results": 15, "videos": videos}
+
+def start_fake_pexels(clip_paths):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePexelsHandler)
+    FakePexelsHandler.clip_paths = clip_paths
+    FakePexelsHandler.base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, FakePexelsHandler.base_url
+
+def make_synthetic_clips(directory, ffmpeg_binary):
+    paths = []
+    for index in range(SYNTHETIC_CLIP_COUNT):
+        path = os.path.join(directory, "clip_{}.mp4".format(index))
+        subprocess.run([ffmpeg_binary, "-y", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+                        "-i", "testsrc2=size=1920x1080:rate=30:duration={}".format(SYNTHETIC_CLIP_SECONDS),
+                        "-vf", "hue=h={}".format(index * 90), "-c:v", "libx264", "-preset", "ultrafast",
+                        "-pix_fmt", "yuv420p", path], check=True)
+        paths.append(path)
+    return paths
+
+def make_synthetic_narration(path, seconds):
+    # a tone with a syllable-rate envelope, close enough to speech for encoders and muxers
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        frames = bytearray()
+        for n in range(int(seconds * SAMPLE_RATE)):
+            t = n / SAMPLE_RATE
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * t)
+            frames += struct.pack("<h", int(8000 * envelope * math.sin(2 * math.pi * 220 * t)))
+        f.writeframes(bytes(frames))
+    return path
+
+def synthetic_word_timings(seconds):
+    # ~2.5 words per second, rescaled so the last word ends with the narration
+    from benchmarks.caption_timing import synthetic_analysis
+    analysis = synthetic_analysis(int(seconds * 2.5))
+    words = [word for segment in analysis["segments"] for word in segment["words"]]
+    scale = seconds / words[-1]["end"]
+    for word in words:
+        word["start"] *= scale
+        word["end"] *= scale
+    return analysis
+
+def keyword_response(timed_captions, keywords, segment_seconds=3):
+    # the timed keyword JSON the LLM returns, one recorded keyword list per segment
+    end = timed_captions[-1][0][1]
+    segments = []
+    t = 0
+    while t < end:
+        t2 = min(t + segment_seconds, end)
+        segments.append([[round(t, 2), round(t2, 2)], keywords[len(segments) % len(keywords)]])
+        t = t2
+    return json.dumps(segments)
+
+def timed(results, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    results[stage] = time.perf_counter() - start
+    return value
+
+def benchmark_length(seconds, fixtures, work_dir, backend):
+    from utility.captions.timed_captions_generator import getCaptionsWithTime
+    from utility.script import script_generator
+    from utility.video import video_search_query_generator, background_video_generator
+    from utility.render.clip_downloader import download_clips
+    from utility.render.render_engine import get_output_media
+
+    results = {}
+    audio_path = make_synthetic_narration(os.path.join(work_dir, "narration_{}.wav".format(seconds)), seconds)
+    analysis = synthetic_word_timings(seconds)
+
+    timed_captions = timed(results, "caption_alignment", getCaptionsWithTime, analysis)
+
+    script_generator.client = RecordedLLMClient([fixtures["script"]])
+    script = timed(results, "script_generation", script_generator.generate_script, "offline benchmark")
+
+    video_search_query_generator.client = RecordedLLMClient([keyword_response(timed_captions, fixtures["keywords"])])
+    search_terms = timed(results, "keyword_generation", video_search_query_generator.getVideoSearchQueriesTimed,
+                         script, timed_captions)
+
+    # cold caches, so every length pays for its own searches, downloads and caption images
+    for cache_dir in (os.environ["PEXELS_CACHE_DIR"], os.environ["CLIP_CACHE_DIR"], os.environ["CAPTION_PNG_DIR"],
+                      os.environ["MEZZANINE_DIR"], os.path.dirname(os.environ["LIBRARY_INDEX_PATH"])):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    background_video_urls = timed(results, "search_resolution", background_video_generator.generate_video_url,
+                                  search_terms, "pexel")
+    background_video_urls = video_search_query_generator.merge_empty_intervals(background_video_urls)
+
+    urls = [url for _, url in background_video_urls if url]
+    timed(results, "download", lambda: list(download_clips(urls)))
+
+    output_path = os.path.join(work_dir, "rendered_{}.mp4".format(seconds))
+    timed(results, "render", get_output_media, audio_path, timed_captions, background_video_urls, "pexel",
+          backend=backend, output_file_name=output_path)
+
+    results["segments"] = len(background_video_urls)
+    results["captions"] = len(timed_captions)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIRECTORY).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print("\nCompared to {} ({}):".format(previous.get("commit"), previous_path))
+    for length, stages in current["lengths"].items():
+        for stage, value in stages.items():
+            before = previous.get("lengths", {}).get(length, {}).get(stage)
+            if isinstance(before, float) and before > 0:
+                print("  {:>4}s {:<20} {:>9.3f}s -> {:>9.3f}s ({:+.1f}%)".format(
+                    length, stage, before, value, 100 * (value - before) / before))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local stand-ins for LLM, TTS and Pexels.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[15, 30, 60], help="Video lengths in seconds")
+    parser.add_argument("--backend", choices=["moviepy", "ffmpeg", "parallel"], default="ffmpeg")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--output", help="Where to store the results (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ttv_benchmark_")
+    # the caches read these at import time, so they must be set before the pipeline modules load
+    os.environ["CLIP_CACHE_DIR"] = os.path.join(work_dir, "cache", "clips")
+    os.environ["PEXELS_CACHE_DIR"] = os.path.join(work_dir, "cache", "pexels")
+    os.environ["CAPTION_PNG_DIR"] = os.path.join(work_dir, "cache", "captions")
+    os.environ["MEZZANINE_DIR"] = os.path.join(work_dir, "cache", "mezzanine")
+    os.environ["LIBRARY_INDEX_PATH"] = os.path.join(work_dir, "cache", "library", "library.sqlite")
+    os.environ["GROQ_API_KEY"] = ""
+    os.environ.setdefault("OPENAI_KEY", "offline-benchmark")
+    os.environ["PEXELS_KEY"] = "offline-benchmark"
+    sys.path.insert(0, REPO_DIRECTORY)
+
+    from utility.render.ffmpeg_backend import get_ffmpeg_binary
+    from utility.video import background_video_generator
+
+    with open(FIXTURES_PATH) as f:
+        fixtures = json.load(f)
+
+    previous_directory = os.getcwd()
+    os.chdir(work_dir)  # response logs and moviepy temp files stay out of the repository
+    try:
+        server, base_url = start_fake_pexels(make_synthetic_clips(work_dir, get_ffmpeg_binary()))
+        background_video_generator.PEXELS_API_URL = base_url + "/videos/search"
+        background_video_generator.SEARCH_CACHE_DIRECTORY = os.environ["PEXELS_CACHE_DIR"]
+
+        report = {"commit": git_commit(), "timestamp": datetime.now().isoformat(), "backend": args.backend,
+                  "lengths": {}}
+        for seconds in args.lengths:
+            print("Benchmarking a {}s video...".format(seconds))
+            report["lengths"][str(seconds)] = benchmark_length(seconds, fixtures, work_dir, args.backend)
+        server.shutdown()
+    finally:
+        os.chdir(previous_directory)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n{:>6} {:<20} {:>10}".format("length", "stage", "seconds"))
+    for length, stages in report["lengths"].items():
+        for stage, value in stages.items():
+            if isinstance(value, float):
+                print("{:>5}s {:<20} {:>10.3f}".format(length, stage, value))
+
+    output_path = args.output or os.path.join(RESULTS_DIRECTORY, "{}_{}.json".format(
+        datetime.now().strftime("%Y%m%d_%H%M%S"), report["commit"]))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("\nResults written to {}".format(output_path))
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Peak memory check for the MoviePy render on a long synthetic timeline.
+
+Renders a video with many short background segments through get_output_media (moviepy
+backend), samples the ffmpeg decoder processes the render keeps alive, and reports the peak
+RSS of the render process and of its decoders. Exits non-zero when more decoders than
+MAX_OPEN_READERS were alive at once or the peak RSS exceeds --max-rss-mb, so it can guard
+against regressions to one open reader per segment.
+
+    python -m benchmarks.peak_rss [--segments 120] [--max-readers 4] [--max-rss-mb 1024]
+
+Linux only (decoders are sampled from /proc). Requires ffmpeg (imageio-ffmpeg) and moviepy.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPO_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+
+SYNTHETIC_CLIP_COUNT = 8
+
+def make_clips(directory, ffmpeg_binary, size, seconds):
+    paths = []
+    for index in range(SYNTHETIC_CLIP_COUNT):
+        path = os.path.join(directory, "clip_{}.mp4".format(index))
+        subprocess.run([ffmpeg_binary, "-y", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+                        "-i", "testsrc2=size={}:rate=30:duration={}".format(size, seconds),
+                        "-vf", "hue=h={}".format(index * 45), "-c:v", "libx264", "-preset", "ultrafast",
+                        "-pix_fmt", "yuv420p", path], check=True)
+        paths.append(path)
+    return paths
+
+def child_processes(pid):
+    # (pid, rss_bytes) of the live direct children of pid
+    children = []
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(name)) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields after the command name: state, ppid, ... rss is the 22nd of them
+        if int(fields[1]) == pid:
+            children.append((int(name), int(fields[21]) * page_size))
+    return children
+
+class ProcessSampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_children = 0
+        self.peak_children_rss = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        pid = os.getpid()
+        while not self._stop_event.is_set():
+            children = child_processes(pid)
+            self.peak_children = max(self.peak_children, len(children))
+            self.peak_children_rss = max(self.peak_children_rss, sum(rss for _, rss in children))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Check peak memory and open decoders of a long MoviePy render.")
+    parser.add_argument("--segments", type=int, default=120, help="Background segments on the timeline")
+    parser.add_argument("--segment-seconds", type=float, default=1.0)
+    parser.add_argument("--size", default="640x360", help="Synthetic clip size")
+    parser.add_argument("--max-readers", type=int, default=4, help="Decoders the render may keep open")
+    parser.add_argument("--max-rss-mb", type=float, default=1024, help="Budget for the render process peak RSS")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ttv_peak_rss_")
+    # the caches read these at import time, so they must be set before the pipeline modules load
+    os.environ["CLIP_CACHE_DIR"] = os.path.join(work_dir, "cache", "clips")
+    os.environ["MEZZANINE"] = "0"
+    os.environ["MAX_OPEN_READERS"] = str(args.max_readers)
+    sys.path.insert(0, REPO_DIRECTORY)
+
+    from benchmarks.offline import make_synthetic_narration
+    from utility.render.clip_cache import cached_clip_path
+    from utility.render.ffmpeg_backend import get_ffmpeg_binary
+    from utility.render.render_engine import get_output_media
+    from utility.instrumentation import peak_rss_bytes, profile_run
+
+    previous_directory = os.getcwd()
+    os.chdir(work_dir)  # moviepy temp files stay out of the repository
+    try:
+        clips = make_clips(work_dir, get_ffmpeg_binary(), args.size, args.segment_seconds + 1)
+        duration = args.segments * args.segment_seconds
+        audio_path = make_synthetic_narration(os.path.join(work_dir, "narration.wav"), duration)
+
+        # every segment gets its own url, already in the clip cache, so each needs its own reader
+        background_video_data = []
+        for index in range(args.segments):
+            url = "http://offline.invalid/videos/segment_{}.mp4".format(index)
+            path = cached_clip_path(url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(clips[index % len(clips)], path)
+            t1 = index * args.segment_seconds
+            background_video_data.append(((t1, t1 + args.segment_seconds), url))
+
+        sampler = ProcessSampler()
+        sampler.start()
+        start = time.perf_counter()
+        with profile_run("peak_rss") as profile:
+            get_output_media(audio_path, [], background_video_data, "pexel", backend="moviepy",
+                             output_file_name=os.path.join(work_dir, "rendered.mp4"))
+        seconds = time.perf_counter() - start
+        sampler.stop()
+    finally:
+        os.chdir(previous_directory)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    peak_rss_mb = peak_rss_bytes() / 1024 ** 2
+    # the encoder and the narration reader run next to the clip decoders
+    peak_decoders = max(0, sampler.peak_children - 2)
+    print("\nsegments:               {}".format(args.segments))
+    print("render time:            {:.1f}s".format(seconds))
+    print("readers opened:         {:.0f}".format(profile.counters.get("clip_readers_opened", 0)))
+    print("peak child processes:   {} (~{} clip decoders)".format(sampler.peak_children, peak_decoders))
+    print("peak child RSS:         {:.1f} MB".format(sampler.peak_children_rss / 1024 ** 2))
+    print("peak render RSS:        {:.1f} MB".format(peak_rss_mb))
+
+    failures = []
+    if peak_decoders > args.max_readers:
+        failures.append("{} clip decoders open at once, limit is {}".format(peak_decoders, args.max_readers))
+    if peak_rss_mb > args.max_rss_mb:
+        failures.append("peak RSS {:.1f} MB over the {:.0f} MB budget".format(peak_rss_mb, args.max_rss_mb))
+    for failure in failures:
+        print("FAIL: " + failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,70 @@
-import edge_tts
+import os
+import asyncio
+from utility.audio.tts_cache import (decode_to_pcm, get_cached_chunk, join_chunks, split_narration, store_chunk,
+                                     tts_cache_key)
+from utility.instrumentation import increment, instrumented
 
-async def generate_audio(script, file_name):
+VOICE = "en-AU-WilliamNeural"
+RATE = "+0%"
+
+# narration chunks synthesized at the same time
+TTS_CONCURRENCY = int(os.environ.get("TTS_CONCURRENCY", 4))
+
+# edge-tts reports offsets and durations in 100-nanosecond ticks
+TICKS_PER_SECOND = 10_000_000
+
+def word_boundaries_to_analysis(words):
+    """
+    Wraps TTS word timings in the same shape whisper_timestamped returns, so the result
+    can be passed straight to getCaptionsWithTime.
+    """
+    text = " ".join(word['text'] for word in words)
+    segment = {
+        "id": 0,
+        "start": words[0]['start'] if words else 0.0,
+        "end": words[-1]['end'] if words else 0.0,
+        "text": text,
+        "words": words,
+    }
+    return {"text": text, "segments": [segment] if words else [], "language": "en"}
+
+async def synthesize_chunk(text, semaphore, voice=VOICE, rate=RATE):
+    # (pcm, words) for one narration chunk, from the TTS cache when the same text was voiced before
+    key = tts_cache_key(text, voice, rate)
+    cached = get_cached_chunk(key)
+    if cached is not None:
+        increment("tts_cache_hits")
+        return cached
+
+    import edge_tts
+
+    async with semaphore:
+        increment("tts_requests")
+        audio = bytearray()
+        words = []
+        async for chunk in edge_tts.Communicate(text, voice, rate=rate).stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                start = chunk["offset"] / TICKS_PER_SECOND
+                end = (chunk["offset"] + chunk["duration"]) / TICKS_PER_SECOND
+                words.append({"text": chunk["text"], "start": start, "end": end})
+        pcm = await decode_to_pcm(bytes(audio))
+    store_chunk(key, pcm, words)
+    return pcm, words
+
+@instrumented()
+async def generate_audio(script, file_name, word_boundaries=False, chunked=True):
+    """
+    Synthesizes the narration into file_name. With word_boundaries=True the word timings
+    the TTS stream carries are returned in whisper_analysis shape; otherwise nothing is
+    returned.
+
+    By default the narration is split into paragraphs (or sentence runs), which are voiced
+    concurrently, cached by (text, voice, rate) and joined sample-exact into a WAV file, so
+    a retry or a one-paragraph edit only re-synthesizes what changed. chunked=False sends
+    the whole text in one request as before.
+    """
     # If input is a dict with a script key, extract it
     if isinstance(script, dict) and 'script' in script:
         script = script['script']
@@ -17,5 +81,25 @@ async def generate_audio(script, file_name):
     else:
         raise TypeError("script must be a list of scenes or a string")
 
-    communicate = edge_tts.Communicate(text, "en-AU-WilliamNeural")
-    await communicate.save(file_name)
\ No newline at end of file
+    if chunked:
+        semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+        chunks = await asyncio.gather(*(synthesize_chunk(chunk, semaphore) for chunk in split_narration(text)))
+        words = join_chunks(chunks, file_name)
+        return word_boundaries_to_analysis(words) if word_boundaries else None
+
+    import edge_tts
+    communicate = edge_tts.Communicate(text, VOICE)
+    if not word_boundaries:
+        await communicate.save(file_name)
+        return None
+
+    words = []
+    with open(file_name, "wb") as audio_file:
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_file.write(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                start = chunk["offset"] / TICKS_PER_SECOND
+                end = (chunk["offset"] + chunk["duration"]) / TICKS_PER_SECOND
+                words.append({"text": chunk["text"], "start": start, "end": end})
+    return word_boundaries_to_analysis(words)
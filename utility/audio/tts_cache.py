@@ -0,0 +1,98 @@
+import os
+import re
+import json
+import wave
+import asyncio
+import hashlib
+from utility.utils import atomic_write, evict_lru
+from utility.render.ffmpeg_backend import get_ffmpeg_binary
+
+# synthesized chunks as decoded PCM plus their word timings, keyed by (text, voice, rate)
+TTS_CACHE_DIRECTORY = os.environ.get("TTS_CACHE_DIR", ".cache/tts")
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# chunks are whole paragraphs, or runs of sentences when a paragraph is longer than this
+TTS_CHUNK_CHARS = int(os.environ.get("TTS_CHUNK_CHARS", 600))
+
+# edge-tts produces 24 kHz mono; chunks are decoded to 16-bit PCM at that rate and joined sample-exact
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+def split_narration(text, max_chars=TTS_CHUNK_CHARS):
+    chunks = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            chunks.append(paragraph)
+            continue
+        current = ""
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = (current + " " + sentence).strip()
+        if current:
+            chunks.append(current)
+    return chunks
+
+def tts_cache_key(text, voice, rate):
+    return hashlib.sha256(json.dumps([text, voice, rate]).encode("utf-8")).hexdigest()
+
+def _cache_paths(key, cache_dir):
+    return os.path.join(cache_dir, key + ".pcm"), os.path.join(cache_dir, key + ".json")
+
+def get_cached_chunk(key, cache_dir=TTS_CACHE_DIRECTORY):
+    # (pcm_bytes, words) or None; an entry counts only if both of its files survived eviction,
+    # including between the read and the touch that keeps them recent together
+    pcm_path, words_path = _cache_paths(key, cache_dir)
+    try:
+        with open(words_path, encoding="utf-8") as f:
+            words = json.load(f)
+        with open(pcm_path, "rb") as f:
+            pcm = f.read()
+        os.utime(pcm_path, None)
+        os.utime(words_path, None)
+    except (OSError, ValueError):
+        return None
+    return pcm, words
+
+def store_chunk(key, pcm, words, cache_dir=TTS_CACHE_DIRECTORY, max_bytes=TTS_CACHE_MAX_BYTES):
+    # words first, then the audio: a reader that finds the .pcm always finds its timings
+    pcm_path, words_path = _cache_paths(key, cache_dir)
+    atomic_write(words_path, json.dumps(words))
+    atomic_write(pcm_path, pcm)
+    evict_lru(cache_dir, max_bytes, keep=(pcm_path, words_path))
+
+async def decode_to_pcm(audio_bytes):
+    # compressed TTS audio in, raw 16-bit mono samples at SAMPLE_RATE out
+    process = await asyncio.create_subprocess_exec(
+        get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    pcm, error = await process.communicate(audio_bytes)
+    if process.returncode != 0:
+        raise RuntimeError("Could not decode TTS audio: {}".format(error.decode(errors="replace").strip()))
+    return pcm
+
+def join_chunks(chunks, file_name):
+    """
+    Writes the (pcm, words) chunks back to back into one WAV file and returns the words on
+    the joined timeline. Each chunk's offset is the exact sample count before it.
+    """
+    words = []
+    frames = 0
+    with wave.open(file_name, "wb") as audio_file:
+        audio_file.setnchannels(CHANNELS)
+        audio_file.setsampwidth(SAMPLE_WIDTH)
+        audio_file.setframerate(SAMPLE_RATE)
+        for pcm, chunk_words in chunks:
+            # offsets come from the integer frame count, so rounding never accumulates across chunks
+            offset = frames / SAMPLE_RATE
+            audio_file.writeframes(pcm)
+            words.extend(dict(word, start=word["start"] + offset, end=word["end"] + offset) for word in chunk_words)
+            frames += len(pcm) // (SAMPLE_WIDTH * CHANNELS)
+    return words
@@ -0,0 +1,136 @@
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utility.captions.whisper_model_registry import get_whisper_model, model_lock, warm_up
+from utility.render.ffmpeg_backend import get_ffmpeg_binary, probe_duration
+
+# narration is cut near every TRANSCRIBE_CHUNK_SECONDS, preferably inside a silence
+TRANSCRIBE_CHUNK_SECONDS = float(os.environ.get("TRANSCRIBE_CHUNK_SECONDS", 30))
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", max(1, min(4, (os.cpu_count() or 1) // 2))))
+
+# silence detection: quieter than SILENCE_DB for at least SILENCE_MIN_SECONDS
+SILENCE_DB = -35
+SILENCE_MIN_SECONDS = 0.3
+
+# how far from the target a silence may be, and the overlap used when a cut has to fall inside speech
+SILENCE_SEARCH_SECONDS = 8.0
+CUT_OVERLAP_SECONDS = 1.0
+
+def detect_silences(audio_path, noise_db=SILENCE_DB, min_seconds=SILENCE_MIN_SECONDS):
+    # (start, end) of every silence ffmpeg's silencedetect reports
+    result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-nostats", "-i", audio_path,
+                             "-af", "silencedetect=noise={}dB:d={}".format(noise_db, min_seconds), "-f", "null", "-"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    log = result.stderr.decode(errors="replace")
+    starts = [float(value) for value in re.findall(r"silence_start: (-?\d+(?:\.\d+)?)", log)]
+    ends = [float(value) for value in re.findall(r"silence_end: (\d+(?:\.\d+)?)", log)]
+    return list(zip(starts, ends))
+
+def plan_transcription_chunks(duration, silences, chunk_seconds=TRANSCRIBE_CHUNK_SECONDS):
+    """
+    Returns (read_start, read_end, own_start, own_end) per chunk. Each chunk is cut at the
+    middle of the silence nearest to its target length. Where no silence is close enough,
+    the cut falls in speech and both neighbours read CUT_OVERLAP_SECONDS past it. Every word
+    belongs to the one chunk whose [own_start, own_end) holds its midpoint.
+    """
+    cuts = []
+    position = 0.0
+    while duration - position > chunk_seconds * 1.5:
+        target = position + chunk_seconds
+        candidates = [((start + end) / 2, True) for start, end in silences
+                      if position + chunk_seconds / 2 < (start + end) / 2 < duration
+                      and abs((start + end) / 2 - target) <= SILENCE_SEARCH_SECONDS]
+        cut, silent = min(candidates, key=lambda candidate: abs(candidate[0] - target), default=(target, False))
+        cuts.append((cut, silent))
+        position = cut
+
+    chunks = []
+    own_start, read_start = 0.0, 0.0
+    for cut, silent in cuts + [(duration, True)]:
+        overlap = 0.0 if silent else CUT_OVERLAP_SECONDS
+        chunks.append((read_start, min(duration, cut + overlap), own_start, cut))
+        own_start, read_start = cut, max(0.0, cut - overlap)
+    return chunks
+
+def extract_chunk(audio_path, read_start, read_end, output_path):
+    # 16 kHz mono, which is what Whisper resamples to anyway
+    subprocess.run([get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+                    "-ss", "{:.3f}".format(read_start), "-t", "{:.3f}".format(read_end - read_start),
+                    "-i", audio_path, "-ac", "1", "-ar", "16000", output_path], check=True)
+    return output_path
+
+def _init_worker(model_size, device, dtype, threads):
+    # every worker process loads its own model once, before its first chunk
+    import torch
+    torch.set_num_threads(threads)
+    warm_up((model_size,), device=device, dtype=dtype)
+
+def transcribe_chunk(job):
+    chunk_path, model_size, device, dtype = job
+    from whisper_timestamped import transcribe_timestamped
+    model = get_whisper_model(model_size, device=device, dtype=dtype)
+    return transcribe_timestamped(model, chunk_path, verbose=False, fp16=(dtype == "float16"))
+
+def stitch_transcriptions(chunks, results):
+    """
+    Merges per-chunk whisper_timestamped results into one analysis on the global timeline.
+    Word and segment times are shifted by each chunk's read_start, and words outside the
+    chunk's own range are dropped, so words heard twice in an overlap are kept once.
+    """
+    segments = []
+    for (read_start, _, own_start, own_end), result in zip(chunks, results):
+        for segment in result.get("segments", []):
+            words = []
+            for word in segment.get("words", []):
+                word = dict(word, start=word["start"] + read_start, end=word["end"] + read_start)
+                if own_start <= (word["start"] + word["end"]) / 2 < own_end:
+                    words.append(word)
+            if not words:
+                continue
+            segments.append(dict(segment, id=len(segments), start=words[0]["start"], end=words[-1]["end"],
+                                 text=" " + " ".join(word["text"] for word in words), words=words))
+    language = next((result.get("language") for result in results if result.get("language")), None)
+    return {
+        "text": " ".join(word["text"] for segment in segments for word in segment["words"]),
+        "segments": segments,
+        "language": language,
+    }
+
+def transcribe_chunked(audio_filename, model_size="base", device="cpu", dtype="float32",
+                       chunk_seconds=TRANSCRIBE_CHUNK_SECONDS, workers=TRANSCRIBE_WORKERS):
+    """
+    Transcribes long narration as silence-aligned chunks in a process pool, each worker
+    holding its own Whisper model, and returns a whisper_timestamped-shaped analysis for
+    the whole file that getCaptionsWithTime accepts unchanged.
+    """
+    duration = probe_duration(audio_filename)
+    chunks = plan_transcription_chunks(duration, detect_silences(audio_filename), chunk_seconds)
+    if len(chunks) == 1:
+        # short narration: a process pool would only add model loads
+        from whisper_timestamped import transcribe_timestamped
+        with model_lock(model_size, device=device, dtype=dtype):
+            return transcribe_timestamped(get_whisper_model(model_size, device=device, dtype=dtype), audio_filename,
+                                          verbose=False, fp16=(dtype == "float16"))
+
+    workers = max(1, min(workers, len(chunks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    work_dir = tempfile.mkdtemp(prefix="transcribe_chunks_")
+    try:
+        jobs = []
+        for index, (read_start, read_end, _, _) in enumerate(chunks):
+            chunk_path = extract_chunk(audio_filename, read_start, read_end,
+                                       os.path.join(work_dir, "chunk_{:04d}.wav".format(index)))
+            jobs.append((chunk_path, model_size, device, dtype))
+
+        # spawn, since forking a process that already holds torch state is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(model_size, device, dtype, threads)) as executor:
+            results = list(executor.map(transcribe_chunk, jobs))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return stitch_transcriptions(chunks, results)
@@ -1,11 +1,24 @@
-import whisper_timestamped as whisper
-from whisper_timestamped import load_model, transcribe_timestamped
+from utility.captions.whisper_model_registry import get_whisper_model, model_lock, resolve_device
+from utility.captions.chunked_transcription import TRANSCRIBE_WORKERS, transcribe_chunked
+from utility.instrumentation import instrumented
 import re
+from bisect import bisect_left
 
-def generate_timed_captions(audio_filename,model_size="base"):
-    WHISPER_MODEL = load_model(model_size)
-   
-    gen = transcribe_timestamped(WHISPER_MODEL, audio_filename, verbose=False, fp16=False)
+@instrumented()
+def generate_timed_captions(audio_filename,model_size="base", device=None, dtype="float32", chunked=False,
+                            workers=TRANSCRIBE_WORKERS):
+    if chunked:
+        # long narration: silence-aligned chunks transcribed in a process pool
+        gen = transcribe_chunked(audio_filename, model_size, device=resolve_device(device), dtype=dtype, workers=workers)
+        return getCaptionsWithTime(gen)
+
+    # imported here so caption timing from TTS word boundaries works without whisper installed
+    from whisper_timestamped import transcribe_timestamped
+
+    WHISPER_MODEL = get_whisper_model(model_size, device=device, dtype=dtype)
+
+    with model_lock(model_size, device=device, dtype=dtype):
+        gen = transcribe_timestamped(WHISPER_MODEL, audio_filename, verbose=False, fp16=(dtype == "float16"))
    
     return getCaptionsWithTime(gen)
 
@@ -13,13 +26,15 @@ def splitWordsBySize(words, maxCaptionSize):
    
     halfCaptionSize = maxCaptionSize / 2
     captions = []
-    while words:
-        caption = words[0]
-        words = words[1:]
-        while words and len(caption + ' ' + words[0]) <= maxCaptionSize:
-            caption += ' ' + words[0]
-            words = words[1:]
-            if len(caption) >= halfCaptionSize and words:
+    # walk the list with a cursor instead of re-slicing it, which made long transcripts quadratic
+    i = 0
+    while i < len(words):
+        caption = words[i]
+        i += 1
+        while i < len(words) and len(caption + ' ' + words[i]) <= maxCaptionSize:
+            caption += ' ' + words[i]
+            i += 1
+            if len(caption) >= halfCaptionSize and i < len(words):
                 break
         captions.append(caption)
     return captions
@@ -35,6 +50,22 @@ def getTimestampMapping(whisper_analysis):
             index = newIndex
     return locationToTimestamp
 
+def getTimestampIndex(whisper_analysis):
+    """
+    Sorted counterpart of getTimestampMapping: the end character offset of every word and
+    its end time. The word intervals are contiguous, so the word covering a position is the
+    first one whose end offset is >= that position.
+    """
+    index = 0
+    ends = []
+    times = []
+    for segment in whisper_analysis['segments']:
+        for word in segment['words']:
+            index = index + len(word['text'])+1
+            ends.append(index)
+            times.append(word['end'])
+    return ends, times
+
 def cleanWord(word):
    
     return re.sub(r'[^\w\s\-_"\'\']', '', word)
@@ -46,9 +77,17 @@ def interpolateTimeFromDict(word_position, d):
             return value
     return None
 
+def interpolateTimeFromIndex(word_position, timestampIndex):
+
+    ends, times = timestampIndex
+    i = bisect_left(ends, word_position)
+    if i < len(ends):
+        return times[i]
+    return None
+
 def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation=False):
    
-    wordLocationToTime = getTimestampMapping(whisper_analysis)
+    wordLocationToTime = getTimestampIndex(whisper_analysis)
     position = 0
     start_time = 0
     CaptionsPairs = []
@@ -63,7 +102,7 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
     
     for word in words:
         position += len(word) + 1
-        end_time = interpolateTimeFromDict(position, wordLocationToTime)
+        end_time = interpolateTimeFromIndex(position, wordLocationToTime)
         if end_time and word:
             CaptionsPairs.append(((start_time, end_time), word))
             start_time = end_time
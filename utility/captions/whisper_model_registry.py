@@ -0,0 +1,58 @@
+import threading
+
+# models already loaded in this process, keyed by (model_size, device, dtype)
+_models = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+_use_locks = {}
+
+def resolve_device(device=None):
+    if device:
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def get_whisper_model(model_size="base", device=None, dtype="float32"):
+    """
+    Returns the Whisper model for (model_size, device, dtype), loading it on first use.
+    Later calls from any thread get the same resident instance. Loads of different keys
+    can run in parallel; concurrent requests for the same key wait for a single load.
+    """
+    key = (model_size, resolve_device(device), dtype)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        model = _models.get(key)
+        if model is None:
+            from whisper_timestamped import load_model
+            model = load_model(model_size, device=key[1])
+            if dtype == "float16":
+                model = model.half()
+            model.eval()
+            _models[key] = model
+    return model
+
+def model_lock(model_size="base", device=None, dtype="float32"):
+    """
+    Returns the lock to hold while transcribing with a shared model: whisper_timestamped
+    attaches hooks to the model for the duration of a call, so calls must not interleave.
+    """
+    key = (model_size, resolve_device(device), dtype)
+    with _registry_lock:
+        return _use_locks.setdefault(key, threading.Lock())
+
+def warm_up(model_sizes=("base",), device=None, dtype="float32"):
+    # load the given models ahead of the first transcription, e.g. at worker start
+    for model_size in model_sizes:
+        get_whisper_model(model_size, device=device, dtype=dtype)
+
+def unload_models():
+    with _registry_lock:
+        _models.clear()
+        _load_locks.clear()
+        _use_locks.clear()
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import inspect
+import cProfile
+import functools
+import threading
+import contextvars
+from datetime import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# per-run profiles written by app.py
+DIRECTORY_RUN_PROFILES = ".logs/run_profiles"
+
+# set to a directory to write a cProfile dump for every top-level stage span
+CPROFILE_DIRECTORY = os.environ.get("TTV_CPROFILE_DIR")
+
+_current_profile = contextvars.ContextVar("run_profile", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+# cProfile allows one active profiler per process from Python 3.12, so spans share this flag
+_profiler_lock = threading.Lock()
+_profiler_active = False
+
+def peak_rss_bytes(children=False):
+    # high-water mark of resident memory for this process (or its finished children, e.g. ffmpeg)
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+class RunProfile:
+    """
+    Spans and counters recorded while producing one video. Safe to update from the worker
+    threads the pipeline uses.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self.spans = []
+        self.counters = defaultdict(float)
+        self.wall_seconds = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self._start
+
+    def stage_totals(self):
+        # spans aggregated per stage name: calls, wall and cpu seconds
+        totals = {}
+        with self._lock:
+            for record in self.spans:
+                total = totals.setdefault(record["name"], {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+                total["calls"] += 1
+                total["wall_seconds"] += record["wall_seconds"]
+                total["cpu_seconds"] += record["cpu_seconds"]
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        return {
+            "run": self.name,
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "peak_child_rss_bytes": peak_rss_bytes(children=True),
+            "counters": counters,
+            "stages": self.stage_totals(),
+            "spans": spans,
+        }
+
+    def write_json(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def to_prometheus(self):
+        # Prometheus text exposition format, one gauge family per measurement
+        run = self.name.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        lines = []
+
+        def family(metric, help_text, samples):
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} gauge".format(metric))
+            for labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, val) for key, val in [("run", run)] + labels)
+                lines.append("{}{{{}}} {}".format(metric, label_text, value))
+
+        totals = self.stage_totals()
+        family("ttv_stage_calls", "Number of times the stage ran.",
+               [([("stage", name)], total["calls"]) for name, total in totals.items()])
+        family("ttv_stage_wall_seconds", "Wall-clock time spent in the stage.",
+               [([("stage", name)], total["wall_seconds"]) for name, total in totals.items()])
+        family("ttv_stage_cpu_seconds", "Process CPU time elapsed while the stage ran.",
+               [([("stage", name)], total["cpu_seconds"]) for name, total in totals.items()])
+        with self._lock:
+            counters = dict(self.counters)
+        family("ttv_counter", "Pipeline counters such as bytes downloaded and cache hits.",
+               [([("name", name)], value) for name, value in sorted(counters.items())])
+        if self.wall_seconds is not None:
+            family("ttv_run_wall_seconds", "Wall-clock time of the whole run.", [([], self.wall_seconds)])
+        rss = peak_rss_bytes()
+        if rss is not None:
+            family("ttv_peak_rss_bytes", "Peak resident memory of the process.", [([], rss)])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+        return path
+
+# catches measurements taken outside of any profile_run, e.g. when modules are used directly
+_process_profile = RunProfile("process")
+
+def current_profile():
+    return _current_profile.get() or _process_profile
+
+@contextmanager
+def profile_run(name):
+    # every span and counter recorded in this context (and the tasks and bound threads it starts) lands here
+    profile = RunProfile(name)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        profile.finish()
+        _current_profile.reset(token)
+
+def increment(counter, amount=1):
+    current_profile().increment(counter, amount)
+
+def bind_context(func):
+    """
+    Returns func bound to a copy of the caller's context, for handing work to a thread pool:
+    executor threads do not inherit context variables, so their spans and counters would
+    otherwise miss the current run. Bind once per submission.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+def enable_cprofile(directory):
+    # opt in to per-stage cProfile dumps from code; TTV_CPROFILE_DIR does the same from the environment
+    global CPROFILE_DIRECTORY
+    CPROFILE_DIRECTORY = directory
+
+def _start_cprofile():
+    # one profiler per process: spans starting while one runs, in any thread, are not dumped
+    global _profiler_active
+    if not CPROFILE_DIRECTORY:
+        return None
+    with _profiler_lock:
+        if _profiler_active:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler, e.g. python -m cProfile, is already running
+            return None
+        _profiler_active = True
+    return profiler
+
+def _stop_cprofile(profiler, name):
+    global _profiler_active
+    if profiler is None:
+        return
+    profiler.disable()
+    with _profiler_lock:
+        _profiler_active = False
+    os.makedirs(CPROFILE_DIRECTORY, exist_ok=True)
+    profiler.dump_stats(os.path.join(CPROFILE_DIRECTORY, "{}_{}.prof".format(
+        name, datetime.now().strftime("%Y%m%d_%H%M%S_%f"))))
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as a stage span of the current run: wall time, process CPU time
+    (all threads, so overlapping stages both see shared CPU) and the peak RSS so far.
+    """
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    profiler = _start_cprofile()
+    started_at = datetime.now().isoformat()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {
+            "name": name,
+            "parent": parent,
+            "started_at": started_at,
+            "wall_seconds": time.perf_counter() - wall_start,
+            "cpu_seconds": time.process_time() - cpu_start,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "error": error,
+        }
+        _stop_cprofile(profiler, name)
+        _current_span.reset(token)
+        current_profile().add_span(record)
+
+def instrumented(name=None):
+    # decorator recording every call of a stage function, sync or async, as a span
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def default_profile_path():
+    return os.path.join(DIRECTORY_RUN_PROFILES, "{}_run.json".format(datetime.now().strftime("%Y%m%d_%H%M%S")))
@@ -0,0 +1,100 @@
+import os
+import json
+import hashlib
+from utility.utils import atomic_write, evict_lru
+from utility.instrumentation import increment
+
+# completions are cached on disk under this directory, trimmed to LLM_CACHE_MAX_BYTES
+LLM_CACHE_DIRECTORY = os.environ.get("LLM_CACHE_DIR", ".cache/llm")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 200 * 1024 ** 2))
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+
+def llm_cache_key(model, system_prompt, user_content, temperature=None):
+    key = json.dumps([model, system_prompt, user_content, temperature])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(LLM_CACHE_DIRECTORY, key + ".json")
+
+def get_cached_completion(key):
+    path = _cache_path(key)
+    # the touch is inside the try, so an entry evicted after the read is a miss rather than an error
+    try:
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)["content"]
+        os.utime(path, None)
+    except (OSError, ValueError, KeyError):
+        return None
+    return content
+
+def store_completion(key, content):
+    path = _cache_path(key)
+    atomic_write(path, json.dumps({"content": content}))
+    evict_lru(LLM_CACHE_DIRECTORY, LLM_CACHE_MAX_BYTES, keep=(path,))
+
+def is_valid(content, validate):
+    # validate raising counts as rejecting the completion
+    if validate is None:
+        return True
+    try:
+        return bool(validate(content))
+    except Exception:
+        return False
+
+def _request(model, system_prompt, user_content, temperature, **kwargs):
+    request = dict(model=model, messages=[
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ], **kwargs)
+    if temperature is not None:
+        request["temperature"] = temperature
+    return request
+
+def cached_chat_completion(get_client, model, system_prompt, user_content, temperature=None, validate=None):
+    """
+    Returns the completion text for the request, answering repeated requests with the same
+    model, prompts and temperature from the disk cache instead of calling the API.
+    get_client is only called on a miss, so cache hits never construct an API client.
+    Only completions that validate accepts are cached, so a retry of an answer the caller
+    could not parse asks the API again instead of replaying it.
+    """
+    key = llm_cache_key(model, system_prompt, user_content, temperature)
+    if LLM_CACHE_ENABLED:
+        content = get_cached_completion(key)
+        if content is not None and is_valid(content, validate):
+            increment("llm_cache_hits")
+            return content
+
+    increment("llm_requests")
+    response = get_client().chat.completions.create(**_request(model, system_prompt, user_content, temperature))
+    content = response.choices[0].message.content
+    if LLM_CACHE_ENABLED and content and is_valid(content, validate):
+        store_completion(key, content)
+    return content
+
+def stream_chat_completion(get_client, model, system_prompt, user_content, temperature=None, validate=None):
+    """
+    Yields the completion text in pieces as the API streams it. The full text is cached
+    once the stream completes if validate accepts it; a cache hit yields the whole text
+    as a single piece.
+    """
+    key = llm_cache_key(model, system_prompt, user_content, temperature)
+    if LLM_CACHE_ENABLED:
+        content = get_cached_completion(key)
+        if content is not None and is_valid(content, validate):
+            increment("llm_cache_hits")
+            yield content
+            return
+
+    increment("llm_requests")
+    pieces = []
+    for chunk in get_client().chat.completions.create(**_request(model, system_prompt, user_content, temperature, stream=True)):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            pieces.append(delta)
+            yield delta
+    content = "".join(pieces)
+    if LLM_CACHE_ENABLED and content and is_valid(content, validate):
+        store_completion(key, content)
@@ -0,0 +1,103 @@
+import os
+import re
+import json
+import asyncio
+import traceback
+from datetime import datetime
+from utility.pipeline.orchestrator import (RESOURCE_ENCODE, RESOURCE_NETWORK, RESOURCE_WHISPER,
+                                           build_video_pipeline, run_dag)
+from utility.instrumentation import profile_run
+from utility.utils import atomic_write
+
+# default concurrency per resource class across all jobs of a batch
+RESOURCE_LIMITS = {
+    RESOURCE_NETWORK: int(os.environ.get("BATCH_NETWORK_LIMIT", 8)),
+    RESOURCE_WHISPER: int(os.environ.get("BATCH_WHISPER_LIMIT", 1)),
+    RESOURCE_ENCODE: int(os.environ.get("BATCH_ENCODE_LIMIT", 2)),
+}
+
+# jobs in flight at once; each waits on the resource limits for its heavy stages
+BATCH_JOBS = int(os.environ.get("BATCH_JOBS", 4))
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def read_topics(topics_path):
+    # one topic per line; blank lines and lines starting with # are skipped
+    with open(topics_path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+def job_id_for(index, topic):
+    slug = re.sub(r'[^a-z0-9]+', '-', topic.lower()).strip('-')[:40]
+    return "{:04d}-{}".format(index, slug or "topic")
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return {"jobs": {}}
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state, state_path):
+    # a crash never leaves a truncated state file
+    atomic_write(state_path, json.dumps(state, indent=2))
+
+async def run_batch(topics_path, batch_dir="batch_output", jobs=BATCH_JOBS, limits=None, **pipeline_options):
+    """
+    Renders a video for every topic in topics_path. Each job gets its own work directory
+    under batch_dir/jobs, so jobs never overwrite each other's audio or video. Stages of
+    all jobs share one semaphore per resource class (network, whisper, encode).
+
+    Each job's run profile is written to profile.json in its work directory. Progress is
+    recorded in batch_dir/state.json after every job transition. Rerunning the
+    same batch skips jobs already marked done whose video still exists, and retries the rest.
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    state_path = os.path.join(batch_dir, "state.json")
+    state = load_state(state_path)
+
+    semaphores = {name: asyncio.Semaphore(limit) for name, limit in dict(RESOURCE_LIMITS, **(limits or {})).items()}
+    job_slots = asyncio.Semaphore(jobs)
+
+    def update(job_id, **fields):
+        state["jobs"][job_id].update(fields, updated_at=datetime.now().isoformat())
+        save_state(state, state_path)
+
+    async def run_job(job_id, topic):
+        async with job_slots:
+            work_dir = os.path.join(batch_dir, "jobs", job_id)
+            os.makedirs(work_dir, exist_ok=True)
+            output_file_name = os.path.join(work_dir, "rendered_video.mp4")
+            update(job_id, status=STATUS_RUNNING, error=None)
+            print("Starting job {}: {}".format(job_id, topic))
+            with profile_run(job_id) as profile:
+                try:
+                    stages = build_video_pipeline(topic, audio_file_name=os.path.join(work_dir, "audio_tts.wav"),
+                                                  output_file_name=output_file_name, **pipeline_options)
+                    results = await run_dag(stages, limits=semaphores)
+                except Exception as e:
+                    traceback.print_exc()
+                    update(job_id, status=STATUS_FAILED, error="{}: {}".format(type(e).__name__, e))
+                    return
+                finally:
+                    profile.finish()
+                    profile.write_json(os.path.join(work_dir, "profile.json"))
+            if results["render"] is None:
+                update(job_id, status=STATUS_FAILED, error="No background video found")
+            else:
+                update(job_id, status=STATUS_DONE, output=results["render"])
+            print("Finished job {}: {}".format(job_id, state["jobs"][job_id]["status"]))
+
+    pending = []
+    for index, topic in enumerate(read_topics(topics_path)):
+        job_id = job_id_for(index, topic)
+        job = state["jobs"].setdefault(job_id, {"topic": topic, "status": STATUS_PENDING})
+        if job["status"] == STATUS_DONE and os.path.exists(job.get("output") or ""):
+            print("Skipping finished job {}".format(job_id))
+            continue
+        pending.append(run_job(job_id, topic))
+    save_state(state, state_path)
+
+    await asyncio.gather(*pending)
+    return state
@@ -0,0 +1,178 @@
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from utility.script.script_generator import generate_script
+from utility.audio.audio_generator import generate_audio
+from utility.captions.timed_captions_generator import generate_timed_captions, getCaptionsWithTime
+from utility.captions.whisper_model_registry import warm_up
+from utility.video.background_video_generator import generate_video_url
+from utility.video.video_search_query_generator import (getVideoSearchQueriesTimed, merge_empty_intervals,
+                                                         streamVideoSearchQueriesTimed)
+from utility.render.render_engine import get_output_media
+from utility.render.caption_renderer import render_caption
+from utility.render.clip_downloader import DOWNLOAD_WORKERS, download_clip
+from utility.render.ffmpeg_backend import caption_png_path
+from utility.render.parallel_render import RENDER_CHUNK_SECONDS, RENDER_WORKERS
+from utility.instrumentation import bind_context
+
+# resource classes a stage can be tagged with, used to bound concurrency across pipelines
+RESOURCE_NETWORK = "network"
+RESOURCE_WHISPER = "whisper"
+RESOURCE_ENCODE = "encode"
+
+class Stage:
+    """
+    A node of the pipeline DAG. func receives the dict of results of the stages finished so
+    far and returns this stage's result. Coroutine functions run on the event loop; plain
+    functions are treated as blocking and run in the default executor. resource names the
+    class of resource the stage mainly uses.
+    """
+
+    def __init__(self, name, func, deps=(), resource=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.resource = resource
+
+async def run_dag(stages, limits=None):
+    """
+    Runs every stage as soon as all of its dependencies have finished, so independent
+    stages overlap. limits optionally maps a resource class to an asyncio.Semaphore that a
+    stage of that class holds while it runs; sharing the semaphores between several DAGs
+    bounds their combined use of that resource. Returns the results keyed by stage name;
+    the first failure cancels the stages still running and is re-raised.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError("Stage {} depends on unknown stages {}".format(stage.name, missing))
+
+    loop = asyncio.get_running_loop()
+    results = {}
+    tasks = {}
+
+    async def call(stage):
+        if inspect.iscoroutinefunction(stage.func):
+            return await stage.func(results)
+        return await loop.run_in_executor(None, bind_context(stage.func), results)
+
+    async def run(stage):
+        await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+        semaphore = (limits or {}).get(stage.resource)
+        if semaphore is None:
+            result = await call(stage)
+        else:
+            async with semaphore:
+                result = await call(stage)
+        results[stage.name] = result
+        return result
+
+    # Create every task before any of them runs, so dependencies can be looked up by name
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return results
+
+def build_video_pipeline(topic, audio_file_name="audio_tts.wav", video_server="pexel", tts_captions=False,
+                         render_backend="moviepy", render_workers=RENDER_WORKERS, chunk_seconds=RENDER_CHUNK_SECONDS,
+                         output_file_name="rendered_video.mp4", stream_keywords=False, chunked_whisper=False):
+    """
+    Models app.py's steps as a DAG. Compared to running them in sequence, the Whisper model
+    loads while the script and narration are produced, caption rasterization runs alongside
+    the LLM keyword call and the clip search, and each clip starts downloading as soon as its
+    segment has been resolved instead of after the whole search. With stream_keywords, clip
+    search also starts on each keyword segment while the LLM is still writing the rest.
+    """
+    download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+    downloads = []
+
+    def warm_whisper(results):
+        # chunked transcription loads its models in worker processes instead
+        if not tts_captions and not chunked_whisper:
+            warm_up()
+
+    def script(results):
+        response = generate_script(topic)
+        print("script: {}".format(response))
+        return response
+
+    async def audio(results):
+        return await generate_audio(results["script"], audio_file_name, word_boundaries=tts_captions)
+
+    def captions(results):
+        if results["audio"] is not None:
+            timed_captions = getCaptionsWithTime(results["audio"])
+        else:
+            timed_captions = generate_timed_captions(audio_file_name, chunked=chunked_whisper)
+        print(timed_captions)
+        return timed_captions
+
+    def rasterize_captions(results):
+        # fill the caption cache (arrays for moviepy, PNGs on disk otherwise) the render will read from
+        for _, text in results["captions"]:
+            if render_backend == "moviepy":
+                render_caption(text, fontsize=100, color="white", stroke_color="black", stroke_width=3)
+            else:
+                caption_png_path(text)
+
+    def search_terms(results):
+        if stream_keywords:
+            # consumed lazily by the search stage as the LLM streams its answer
+            return streamVideoSearchQueriesTimed(results["script"], results["captions"])
+        terms = getVideoSearchQueriesTimed(results["script"], results["captions"])
+        print(terms)
+        return terms
+
+    def search(results):
+        if results["search_terms"] is None:
+            print("No background video")
+            return None
+
+        def start_download(index, interval, url):
+            if url:
+                downloads.append(download_executor.submit(bind_context(download_clip), url, None,
+                                                          label="clip {}".format(index + 1)))
+
+        background_video_urls = generate_video_url(results["search_terms"], video_server, on_resolved=start_download)
+        print(background_video_urls)
+        return background_video_urls
+
+    async def download(results):
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in downloads))
+        finally:
+            download_executor.shutdown(wait=False)
+
+    def render(results):
+        background_video_urls = merge_empty_intervals(results["search"]) if results["search"] is not None else None
+        if background_video_urls is None:
+            print("No video")
+            return None
+        # every clip is in the clip cache by now, so the render's own download step only does lookups
+        video = get_output_media(audio_file_name, results["captions"], background_video_urls, video_server,
+                                 backend=render_backend, render_workers=render_workers, chunk_seconds=chunk_seconds,
+                                 output_file_name=output_file_name)
+        print(video)
+        return video
+
+    return [
+        Stage("warm_whisper", warm_whisper, resource=RESOURCE_WHISPER),
+        Stage("script", script, resource=RESOURCE_NETWORK),
+        Stage("audio", audio, deps=["script"], resource=RESOURCE_NETWORK),
+        Stage("captions", captions, deps=["audio", "warm_whisper"], resource=RESOURCE_WHISPER),
+        Stage("rasterize_captions", rasterize_captions, deps=["captions"]),
+        Stage("search_terms", search_terms, deps=["script", "captions"], resource=RESOURCE_NETWORK),
+        Stage("search", search, deps=["search_terms"], resource=RESOURCE_NETWORK),
+        Stage("download", download, deps=["search"]),
+        Stage("render", render, deps=["download", "rasterize_captions"], resource=RESOURCE_ENCODE),
+    ]
+
+async def generate_video(topic, limits=None, **options):
+    results = await run_dag(build_video_pipeline(topic, **options), limits=limits)
+    return results["render"]
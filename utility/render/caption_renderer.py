@@ -0,0 +1,69 @@
+import os
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+# any TrueType font Pillow can resolve by name or path
+CAPTION_FONT = os.environ.get("CAPTION_FONT", "DejaVuSans-Bold.ttf")
+
+# bytes of rendered caption arrays kept in memory; a 1080p caption line is a few hundred KB
+CAPTION_CACHE_MAX_BYTES = int(os.environ.get("CAPTION_CACHE_MAX_BYTES", 64 * 1024 ** 2))
+
+_caption_arrays = OrderedDict()
+_caption_bytes = 0
+_caption_lock = threading.Lock()
+
+@lru_cache(maxsize=32)
+def load_font(font, fontsize):
+    # Pillow and numpy are imported on first render, keeping them out of module import time
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(font, fontsize)
+    except OSError:
+        print("Caption font {} not found, using Pillow's default font".format(font))
+        return ImageFont.load_default(fontsize)
+
+def render_caption_image(text, font=CAPTION_FONT, fontsize=100, color="white", stroke_color="black", stroke_width=3):
+    """
+    Draws stroked caption text on a transparent canvas sized to fit it, in process and
+    without ImageMagick. Not cached: the moviepy render keeps the arrays of render_caption
+    and the ffmpeg backends keep the PNGs on disk.
+    """
+    from PIL import Image, ImageDraw
+    image_font = load_font(font, fontsize)
+    left, top, right, bottom = image_font.getbbox(text, stroke_width=stroke_width)
+    width = max(right - left, 1)
+    height = max(bottom - top, 1)
+
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.text((-left, -top), text, font=image_font, fill=color,
+              stroke_width=stroke_width, stroke_fill=stroke_color)
+    return image
+
+def render_caption(text, font=CAPTION_FONT, fontsize=100, color="white", stroke_color="black", stroke_width=3):
+    """
+    RGBA array for ImageClip, which turns the alpha channel into the clip's mask. Arrays are
+    cached by all of their arguments, least recently used first out once the cache holds
+    more than CAPTION_CACHE_MAX_BYTES; they are read-only, as callers share them.
+    """
+    global _caption_bytes
+    key = (text, font, fontsize, color, stroke_color, stroke_width)
+    with _caption_lock:
+        array = _caption_arrays.get(key)
+        if array is not None:
+            _caption_arrays.move_to_end(key)
+            return array
+
+    import numpy as np
+    # asarray copies the pixels, so the PIL image is dropped and only the array is kept
+    array = np.asarray(render_caption_image(text, font, fontsize, color, stroke_color, stroke_width))
+    array.flags.writeable = False
+    with _caption_lock:
+        if key not in _caption_arrays:
+            _caption_arrays[key] = array
+            _caption_bytes += array.nbytes
+            while _caption_bytes > CAPTION_CACHE_MAX_BYTES and len(_caption_arrays) > 1:
+                _, evicted = _caption_arrays.popitem(last=False)
+                _caption_bytes -= evicted.nbytes
+    return array
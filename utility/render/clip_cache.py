@@ -0,0 +1,69 @@
+import os
+import hashlib
+from utility.utils import atomic_file, evict_lru
+from utility.instrumentation import increment
+
+# clip cache location and size budget (bytes), overridable from the environment
+CLIP_CACHE_DIRECTORY = os.environ.get("CLIP_CACHE_DIR", ".cache/clips")
+CLIP_CACHE_MAX_BYTES = int(os.environ.get("CLIP_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+def clip_cache_key(url):
+    # Pexels serves the same clip under different query strings, so key on the bare link
+    link = url.split('?')[0]
+    return hashlib.sha256(link.encode("utf-8")).hexdigest()
+
+def cached_clip_path(url, cache_dir=CLIP_CACHE_DIRECTORY):
+    extension = os.path.splitext(url.split('?')[0])[1] or ".mp4"
+    return os.path.join(cache_dir, clip_cache_key(url) + extension)
+
+def stream_to_file(url, filename, session=None, progress=None):
+    """
+    Streams url into filename in chunks. The body is written to a temporary file in the
+    same directory and renamed into place, so readers never see a partial download.
+    progress, if given, is called with (bytes_done, bytes_total) after every chunk;
+    bytes_total is None when the server does not send a Content-Length.
+    """
+    if session is None:
+        import requests
+        session = requests
+    http = session
+    with atomic_file(filename) as f:
+        with http.get(url, headers=HEADERS, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            total = response.headers.get("Content-Length")
+            total = int(total) if total else None
+            done = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+    increment("bytes_downloaded", done)
+    return filename
+
+def get_cached_clip(url, cache_dir=CLIP_CACHE_DIRECTORY, max_bytes=CLIP_CACHE_MAX_BYTES, session=None, progress=None):
+    """
+    Returns a local path for the clip at url, downloading it only if it is not cached yet.
+    Hits refresh the file's mtime so eviction drops the least recently used clips first.
+    """
+    path = cached_clip_path(url, cache_dir)
+    # touching the file is the existence check, so an entry evicted meanwhile is simply a miss
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        pass
+    else:
+        increment("clip_cache_hits")
+        return path
+    increment("clip_cache_misses")
+
+    stream_to_file(url, path, session=session, progress=progress)
+    evict_lru(cache_dir, max_bytes, keep=(path,))
+    return path
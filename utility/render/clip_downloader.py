@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utility.render.clip_cache import CLIP_CACHE_DIRECTORY, get_cached_clip
+from utility.utils import create_pooled_session
+from utility.instrumentation import bind_context
+
+# number of clips fetched at the same time
+DOWNLOAD_WORKERS = int(os.environ.get("CLIP_DOWNLOAD_WORKERS", 6))
+DOWNLOAD_ATTEMPTS = 4
+DOWNLOAD_BACKOFF_SECONDS = 1.0
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size=DOWNLOAD_WORKERS):
+    """
+    Returns the process-wide pooled session used for clip downloads. Connection and
+    5xx/429 failures are retried with exponential backoff by urllib3.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_pooled_session(pool_size, retries=DOWNLOAD_ATTEMPTS,
+                                             backoff_factor=DOWNLOAD_BACKOFF_SECONDS)
+        return _session
+
+def _progress_printer(label):
+    # prints each file's progress at 25% steps so parallel downloads don't flood the console
+    state = {"step": 0}
+
+    def progress(done, total):
+        if not total:
+            return
+        step = done * 4 // total
+        if step > state["step"]:
+            state["step"] = step
+            print("{}: {}% ({:.1f} MB)".format(label, step * 25, done / 1024 ** 2))
+    return progress
+
+def is_mid_body_failure(error):
+    # the body stopped arriving after the response had started: a cut-off chunked stream, or a
+    # read timeout while streaming, which requests wraps in ConnectionError
+    import requests
+    from urllib3.exceptions import ReadTimeoutError
+    if isinstance(error, requests.exceptions.ChunkedEncodingError):
+        return True
+    return isinstance(error, requests.exceptions.ConnectionError) and bool(error.args) and \
+        isinstance(error.args[0], ReadTimeoutError)
+
+def download_clip(url, session=None, cache_dir=CLIP_CACHE_DIRECTORY, label=None):
+    # urllib3 retries connecting and 5xx/429 responses; only a body cut off mid-stream is retried here,
+    # so a dead host is not retried again on top of urllib3's attempts
+    import requests
+    session = session or get_session()
+    progress = _progress_printer(label or url)
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        try:
+            return get_cached_clip(url, cache_dir=cache_dir, session=session, progress=progress)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == DOWNLOAD_ATTEMPTS - 1 or not is_mid_body_failure(e):
+                raise
+            time.sleep(DOWNLOAD_BACKOFF_SECONDS * 2 ** attempt)
+
+def download_clips(urls, max_workers=DOWNLOAD_WORKERS, cache_dir=CLIP_CACHE_DIRECTORY):
+    """
+    Downloads urls concurrently and yields (index, path) in completion order, so callers
+    can start working on each clip as soon as it lands. A url repeated in the list is
+    fetched once and yielded for every index it appears at.
+    """
+    indices = defaultdict(list)
+    for index, url in enumerate(urls):
+        indices[url].append(index)
+
+    session = get_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for url in indices:
+            label = "clip {}".format(indices[url][0] + 1)
+            futures[executor.submit(bind_context(download_clip), url, session, cache_dir, label)] = url
+        for future in as_completed(futures):
+            path = future.result()
+            for index in indices[futures[future]]:
+                yield index, path
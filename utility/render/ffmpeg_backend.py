@@ -0,0 +1,159 @@
+import os
+import re
+import math
+import hashlib
+import tempfile
+import subprocess
+from utility.render.caption_renderer import CAPTION_FONT, render_caption_image
+from utility.utils import atomic_file
+from utility.instrumentation import increment
+
+FPS = 25
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+CAPTION_Y = 800
+
+# pre-rendered caption PNGs, shared between renders
+CAPTION_PNG_DIRECTORY = os.environ.get("CAPTION_PNG_DIR", ".cache/captions")
+
+def get_ffmpeg_binary():
+    # the ffmpeg that moviepy uses, so both backends run the same build
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        return "ffmpeg"
+
+def probe_duration(path):
+    # ffmpeg prints "Duration: HH:MM:SS.xx" for its input before failing for lack of an output
+    result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-i", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr.decode(errors="replace"))
+    if not match:
+        raise ValueError("Could not read the duration of {}".format(path))
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def caption_png_path(text, font=CAPTION_FONT, fontsize=100, color="white", stroke_color="black", stroke_width=3):
+    """
+    Returns a PNG of the caption, rendering it only if an identical caption has not been
+    written before. Files are named by a hash of the text and style.
+    """
+    key = repr((text, font, fontsize, color, stroke_color, stroke_width))
+    path = os.path.join(CAPTION_PNG_DIRECTORY, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".png")
+    if not os.path.exists(path):
+        with atomic_file(path) as f:
+            render_caption_image(text, font, fontsize, color, stroke_color, stroke_width).save(f, format="PNG")
+    return path
+
+def to_frame(t, fps=FPS):
+    return int(round(t * fps))
+
+def build_timeline(background_segments, total_frames, fps=FPS):
+    """
+    Lays the ((t1, t2), path) segments out on the frame grid as (frame_count, path) pieces
+    that cover [0, total_frames) exactly. Uncovered time becomes a black piece (path None),
+    and a segment starting before the previous one ended is cut so pieces never overlap.
+    """
+    pieces = []
+    cursor = 0
+    for (t1, t2), path in sorted(background_segments, key=lambda segment: segment[0][0]):
+        start = max(to_frame(t1, fps), cursor)
+        end = min(to_frame(t2, fps), total_frames)
+        if path is None or end <= start:
+            continue
+        if start > cursor:
+            pieces.append((start - cursor, None))
+        pieces.append((end - start, path))
+        cursor = end
+    if cursor < total_frames:
+        pieces.append((total_frames - cursor, None))
+    return pieces
+
+def caption_frames(t1, t2, fps=FPS):
+    # first frame shown and first frame hidden again: frame n is shown while t1 <= n / fps < t2
+    return int(math.ceil(t1 * fps - 1e-6)), int(math.ceil(t2 * fps - 1e-6))
+
+def build_pieces_command(pieces, timed_captions, audio_path, output_path, filter_script_path,
+                         fps=FPS, preset="veryfast", include_audio=True, threads=None, output_format=None):
+    """
+    Compiles (frame_count, path) pieces from build_timeline into one ffmpeg invocation: each
+    clip is conformed to the output size and frame rate, trimmed to its frame count and
+    concatenated, then every caption PNG is overlaid for its frame window. The filtergraph
+    is written to filter_script_path so long timelines do not hit command-line length limits.
+    """
+    total_frames = sum(frame_count for frame_count, _ in pieces)
+    inputs = []
+    input_count = 0
+    filters = []
+    labels = []
+
+    for index, (frame_count, path) in enumerate(pieces):
+        seconds = frame_count / fps
+        if path is None:
+            filters.append("color=c=black:s={}x{}:r={}:d={:.6f},format=yuv420p,trim=end_frame={}[s{}]".format(
+                FRAME_WIDTH, FRAME_HEIGHT, fps, seconds, frame_count, index))
+        else:
+            # read a second past the interval at most; short clips hold their last frame like moviepy
+            inputs += ["-t", "{:.6f}".format(seconds + 1), "-i", path]
+            input_count += 1
+            filters.append(
+                "[{}:v]setpts=PTS-STARTPTS,scale={}:{},setsar=1,fps={},format=yuv420p,"
+                "tpad=stop_mode=clone:stop_duration={:.6f},trim=end_frame={},setpts=PTS-STARTPTS[s{}]".format(
+                    input_count - 1, FRAME_WIDTH, FRAME_HEIGHT, fps, seconds, frame_count, index))
+        labels.append("[s{}]".format(index))
+    filters.append("{}concat=n={}:v=1:a=0[bg]".format("".join(labels), len(labels)))
+
+    current = "[bg]"
+    for index, ((t1, t2), text) in enumerate(timed_captions):
+        first_frame, end_frame = caption_frames(t1, t2, fps)
+        inputs += ["-i", caption_png_path(text)]
+        input_count += 1
+        filters.append("{}[{}:v]overlay=x=(W-w)/2:y={}:enable='gte(n,{})*lt(n,{})'[c{}]".format(
+            current, input_count - 1, CAPTION_Y, first_frame, end_frame, index))
+        current = "[c{}]".format(index)
+    filters.append("{}format=yuv420p[out]".format(current))
+
+    with open(filter_script_path, "w") as f:
+        f.write(";\n".join(filters))
+
+    command = [get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error"] + inputs
+    if include_audio:
+        command += ["-i", audio_path]
+    command += ["-filter_complex_script", filter_script_path, "-map", "[out]"]
+    if include_audio:
+        command += ["-map", "{}:a".format(input_count), "-c:a", "aac"]
+    command += ["-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-r", str(fps)]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += ["-frames:v", str(total_frames)]
+    if output_format:
+        command += ["-f", output_format]
+    command += [output_path]
+    return command
+
+def build_ffmpeg_command(background_segments, timed_captions, audio_path, output_path, duration,
+                         filter_script_path, fps=FPS, preset="veryfast", include_audio=True, threads=None):
+    pieces = build_timeline(background_segments, to_frame(duration, fps), fps)
+    return build_pieces_command(pieces, timed_captions, audio_path, output_path, filter_script_path,
+                                fps=fps, preset=preset, include_audio=include_audio, threads=threads)
+
+def render_with_ffmpeg(audio_file_path, timed_captions, background_segments, output_path, duration=None,
+                       fps=FPS, preset="veryfast"):
+    """
+    Renders the video with a single ffmpeg filter_complex run instead of per-frame
+    compositing in MoviePy. background_segments holds ((t1, t2), local_path) pairs.
+    """
+    if duration is None:
+        duration = probe_duration(audio_file_path)
+
+    fd, filter_script_path = tempfile.mkstemp(suffix=".ffgraph")
+    os.close(fd)
+    try:
+        command = build_ffmpeg_command(background_segments, timed_captions, audio_file_path, output_path,
+                                       duration, filter_script_path, fps=fps, preset=preset)
+        subprocess.run(command, check=True)
+    finally:
+        os.remove(filter_script_path)
+    increment("frames_encoded", to_frame(duration, fps))
+    return output_path
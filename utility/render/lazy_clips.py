@@ -0,0 +1,75 @@
+import os
+import threading
+from collections import OrderedDict
+from moviepy.editor import VideoClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+
+# ffmpeg decoder processes the moviepy render keeps open at once
+MAX_OPEN_READERS = int(os.environ.get("MAX_OPEN_READERS", 4))
+
+class ReaderPool:
+    """
+    Opens clip readers on demand and keeps at most max_open of them alive, closing the least
+    recently used one to make room. Readers whose segment has ended are closed as soon as
+    the render moves past it.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_READERS):
+        self.max_open = max(1, max_open)
+        self.readers = OrderedDict()
+        self.ends = {}
+        self.peak_open = 0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, path, end):
+        with self._lock:
+            reader = self.readers.get(key)
+            if reader is not None:
+                self.readers.move_to_end(key)
+                return reader
+            while len(self.readers) >= self.max_open:
+                _, oldest = self.readers.popitem(last=False)
+                oldest.close()
+            reader = FFMPEG_VideoReader(path)
+            self.readers[key] = reader
+            self.ends[key] = end
+            self.opened += 1
+            self.peak_open = max(self.peak_open, len(self.readers))
+            return reader
+
+    def advance(self, t):
+        # close every reader whose segment ended at or before timeline time t
+        with self._lock:
+            for key in [key for key in self.readers if self.ends[key] <= t]:
+                self.readers.pop(key).close()
+
+    def close_all(self):
+        with self._lock:
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+
+class LazyVideoClip(VideoClip):
+    """
+    Background clip that plays path from its start over the timeline window [t1, t2] like
+    VideoFileClip(path).set_start(t1).set_end(t2), without holding a decoder open outside
+    that window. Size and frame rate are probed once up front; the reader comes from pool.
+    """
+
+    def __init__(self, path, t1, t2, pool):
+        infos = ffmpeg_parse_infos(path)
+        VideoClip.__init__(self)
+        self.filename = path
+        self.size = tuple(infos["video_size"])
+        self.fps = infos["video_fps"]
+        key = (path, t1, t2)
+
+        def make_frame(t):
+            pool.advance(t1 + t)
+            return pool.get(key, path, t2).get_frame(t)
+
+        self.make_frame = make_frame
+        self.start = 0
+        self.duration = t2 - t1
+        self.end = self.duration
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utility.utils import evict_lru
+from utility.render.clip_downloader import DOWNLOAD_WORKERS, download_clips
+from utility.render.ffmpeg_backend import FPS, FRAME_HEIGHT, FRAME_WIDTH, get_ffmpeg_binary
+from utility.instrumentation import bind_context, increment, instrumented
+
+# trimmed and conformed copies of the stock clips, keyed by (source, window, profile)
+MEZZANINE_DIRECTORY = os.environ.get("MEZZANINE_DIR", ".cache/mezzanine")
+MEZZANINE_MAX_BYTES = int(os.environ.get("MEZZANINE_MAX_BYTES", 10 * 1024 ** 3))
+MEZZANINE_ENABLED = os.environ.get("MEZZANINE", "1") != "0"
+
+# extra source time kept past the window, so frame rounding at render time never runs out of frames
+MEZZANINE_MARGIN = float(os.environ.get("MEZZANINE_MARGIN", 0.5))
+MEZZANINE_WORKERS = int(os.environ.get("MEZZANINE_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+
+# near-transparent quality: the mezzanine is encoded once more by the render
+MEZZANINE_CRF = 16
+
+def mezzanine_profile(fps=FPS):
+    # everything the transcode conforms to; part of the cache key so a new profile never reuses old files
+    return {"width": FRAME_WIDTH, "height": FRAME_HEIGHT, "fps": fps, "pix_fmt": "yuv420p",
+            "gop": fps, "codec": "libx264", "crf": MEZZANINE_CRF, "margin": MEZZANINE_MARGIN}
+
+def mezzanine_key(source_path, window, profile):
+    # clip cache files are named by a hash of their URL (without the query string), not by their bytes;
+    # name and size identify the source as long as a Pexels file link keeps serving the same video
+    start, end = window
+    source = (os.path.basename(source_path), os.path.getsize(source_path))
+    key = repr((source, round(start, 3), round(end, 3), sorted(profile.items())))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def build_mezzanine_command(source_path, window, output_path, profile):
+    """
+    Trims the source to window (plus margin) and transcodes it to the output profile. Every
+    GOP is exactly one second with scene-cut keyframes disabled, so seeks land on the frame grid.
+    """
+    start, end = window
+    command = [get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error"]
+    if start > 0:
+        command += ["-ss", "{:.6f}".format(start)]
+    command += ["-t", "{:.6f}".format(end - start + profile["margin"]), "-i", source_path, "-an",
+                "-vf", "scale={}:{},setsar=1,fps={},format={}".format(
+                    profile["width"], profile["height"], profile["fps"], profile["pix_fmt"]),
+                "-c:v", profile["codec"], "-preset", "veryfast", "-crf", str(profile["crf"]),
+                "-pix_fmt", profile["pix_fmt"], "-r", str(profile["fps"]),
+                "-g", str(profile["gop"]), "-keyint_min", str(profile["gop"]), "-sc_threshold", "0",
+                "-movflags", "+faststart", "-f", "mp4", output_path]
+    return command
+
+@instrumented()
+def get_mezzanine(source_path, window, fps=FPS, cache_dir=MEZZANINE_DIRECTORY, max_bytes=MEZZANINE_MAX_BYTES):
+    """
+    Returns a path to source_path cut to window = (start, end) seconds of the source and
+    conformed to the output profile, transcoding only if it is not cached yet.
+    """
+    profile = mezzanine_profile(fps)
+    path = os.path.join(cache_dir, mezzanine_key(source_path, window, profile) + ".mp4")
+    # touching the file is the existence check, so an entry evicted meanwhile is simply transcoded again
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        pass
+    else:
+        increment("mezzanine_cache_hits")
+        return path
+    increment("mezzanine_transcodes")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, part_path = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+    os.close(fd)
+    try:
+        subprocess.run(build_mezzanine_command(source_path, window, part_path, profile), check=True)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    evict_lru(cache_dir, max_bytes, keep=(path,))
+    return path
+
+def ingest_clips(background_video_data, fps=FPS, download_workers=DOWNLOAD_WORKERS, workers=MEZZANINE_WORKERS):
+    """
+    Downloads the clip of every ((t1, t2), url) segment and transcodes it to a mezzanine
+    holding only the t2 - t1 seconds the render plays from it. Each transcode starts as soon
+    as its download lands; yields (index, mezzanine_path) in completion order. Segments
+    without a url are skipped.
+    """
+    indexed = [(index, interval, url) for index, (interval, url) in enumerate(background_video_data) if url]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for position, source_path in download_clips([url for _, _, url in indexed], download_workers):
+            index, (t1, t2), _ = indexed[position]
+            futures[executor.submit(bind_context(get_mezzanine), source_path, (0, t2 - t1), fps)] = index
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,197 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utility.utils import evict_lru
+from utility.render.caption_renderer import CAPTION_FONT
+from utility.render.ffmpeg_backend import (CAPTION_Y, FPS, FRAME_HEIGHT, FRAME_WIDTH, build_pieces_command,
+                                           build_timeline, caption_frames, get_ffmpeg_binary, probe_duration, to_frame)
+from utility.instrumentation import increment
+
+# chunks encoded at the same time, and the length a chunk grows to before a new one starts
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_CHUNK_SECONDS = float(os.environ.get("RENDER_CHUNK_SECONDS", 10))
+
+# encoded chunks kept between renders by the incremental mode, named by their fingerprint
+RENDER_SEGMENT_DIRECTORY = os.environ.get("RENDER_SEGMENT_DIR", ".cache/segments")
+RENDER_SEGMENT_MAX_BYTES = int(os.environ.get("RENDER_SEGMENT_MAX_BYTES", 10 * 1024 ** 3))
+
+def plan_chunks(pieces, chunk_frames):
+    """
+    Groups consecutive timeline pieces into chunks of at least chunk_frames frames. Cuts only
+    fall between pieces, i.e. on background segment boundaries, so no clip is split.
+    Returns (start_frame, pieces) per chunk.
+    """
+    chunks = []
+    current = []
+    start_frame = 0
+    current_frames = 0
+    for frame_count, path in pieces:
+        current.append((frame_count, path))
+        current_frames += frame_count
+        if current_frames >= chunk_frames:
+            chunks.append((start_frame, current))
+            start_frame += current_frames
+            current = []
+            current_frames = 0
+    if current:
+        chunks.append((start_frame, current))
+    return chunks
+
+def chunk_captions(timed_captions, start_frame, frame_count, fps=FPS):
+    # captions visible inside the chunk, moved to chunk-local time on the same frame grid
+    captions = []
+    for (t1, t2), text in timed_captions:
+        first_frame, end_frame = caption_frames(t1, t2, fps)
+        first_frame = max(first_frame, start_frame) - start_frame
+        end_frame = min(end_frame, start_frame + frame_count) - start_frame
+        if end_frame > first_frame:
+            captions.append(((first_frame / fps, end_frame / fps), text))
+    return captions
+
+def source_identity(path):
+    # not a content hash: clip cache files are named by a hash of their URL, and mezzanines by a hash of
+    # their source's name and size, window and profile, so name and size stand in for the clip's bytes
+    if path is None:
+        return None
+    return os.path.basename(path), os.path.getsize(path)
+
+def chunk_fingerprint(pieces, captions, fps=FPS, preset="veryfast"):
+    """
+    Hashes everything that determines a chunk's encoded frames: the clip behind every piece
+    and its frame count, the chunk-local captions and their style, and the output settings.
+    The narration is not part of it, as it is muxed over the joined video afterwards.
+    """
+    key = repr(([(frame_count, source_identity(path)) for frame_count, path in pieces], captions,
+                (CAPTION_FONT, CAPTION_Y), (FRAME_WIDTH, FRAME_HEIGHT, fps, preset)))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def link_or_copy(source, target):
+    # hard link where the filesystem allows it, a copy otherwise
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def render_chunk(job):
+    """
+    Runs in a worker process: captions are rasterized there, then ffmpeg encodes the chunk
+    to output_path. With segment_path, the chunk is also kept there for later renders.
+    """
+    pieces, captions, output_path, segment_path, fps, preset, threads = job
+    # encode to a uniquely named file and rename it into place, so renders sharing the segment
+    # directory never write to the same file and a kept segment is never a partial file
+    directory = os.path.dirname(segment_path or output_path)
+    fd, part_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    os.close(fd)
+    fd, filter_script_path = tempfile.mkstemp(dir=directory, suffix=".ffgraph")
+    os.close(fd)
+    command = build_pieces_command(pieces, captions, None, part_path, filter_script_path,
+                                   fps=fps, preset=preset, include_audio=False, threads=threads, output_format="mp4")
+    try:
+        subprocess.run(command, check=True)
+        if segment_path:
+            link_or_copy(part_path, output_path)
+            os.replace(part_path, segment_path)
+        else:
+            os.replace(part_path, output_path)
+    finally:
+        os.remove(filter_script_path)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return output_path
+
+def concat_chunks(chunk_paths, audio_file_path, output_path, work_dir):
+    """
+    Joins encoded chunks with the concat demuxer without re-encoding the video, and muxes
+    the narration over the whole result in the same pass.
+    """
+    list_path = os.path.join(work_dir, "chunks.txt")
+    with open(list_path, "w") as f:
+        for chunk_path in chunk_paths:
+            f.write("file '{}'\n".format(os.path.abspath(chunk_path).replace("'", "'\\''")))
+
+    command = [get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_file_path:
+        command += ["-i", audio_file_path, "-map", "0:v", "-map", "1:a", "-c:a", "aac"]
+    command += ["-c:v", "copy", output_path]
+    subprocess.run(command, check=True)
+    return output_path
+
+def render_parallel(audio_file_path, timed_captions, background_segments, output_path, duration=None,
+                    workers=RENDER_WORKERS, chunk_seconds=RENDER_CHUNK_SECONDS, fps=FPS, preset="veryfast",
+                    segment_dir=None):
+    """
+    Renders the timeline as independent chunks cut at background segment boundaries, encodes
+    them in a process pool and concatenates them losslessly. Chunks sit on the same frame grid
+    as render_with_ffmpeg, so the frames match the single-process render. The narration is
+    muxed once over the joined video rather than per chunk, which keeps AAC priming gaps
+    out of the chunk joins.
+
+    With segment_dir, encoded chunks are kept there under their fingerprint and reused by
+    later renders: after editing one caption or swapping one clip, only the chunks that
+    changed are encoded again before the concat.
+    """
+    if duration is None:
+        duration = probe_duration(audio_file_path)
+
+    pieces = build_timeline(background_segments, to_frame(duration, fps), fps)
+    chunks = plan_chunks(pieces, max(1, to_frame(chunk_seconds, fps)))
+
+    work_dir = tempfile.mkdtemp(prefix="render_chunks_")
+    try:
+        # the concat reads only files in work_dir, so another render evicting a segment cannot remove them
+        chunk_paths = []
+        segment_paths = set()
+        jobs = {}
+        for index, (start_frame, chunk_pieces) in enumerate(chunks):
+            frame_count = sum(count for count, _ in chunk_pieces)
+            captions = chunk_captions(timed_captions, start_frame, frame_count, fps)
+            chunk_path = os.path.join(work_dir, "chunk_{:05d}.mp4".format(index))
+            chunk_paths.append(chunk_path)
+            segment_path = None
+            if segment_dir:
+                segment_path = os.path.join(segment_dir, chunk_fingerprint(chunk_pieces, captions, fps, preset) + ".mp4")
+                segment_paths.add(segment_path)
+                if segment_path not in jobs:
+                    try:
+                        link_or_copy(segment_path, chunk_path)
+                    except FileNotFoundError:
+                        pass
+                    else:
+                        os.utime(segment_path, None)
+                        increment("segments_reused")
+                        continue
+            # identical chunks within one render are encoded once and linked to the other positions
+            job_key = segment_path or chunk_path
+            if job_key in jobs:
+                jobs[job_key][1].append(chunk_path)
+            else:
+                jobs[job_key] = ((chunk_pieces, captions, chunk_path, segment_path, fps, preset), [], frame_count)
+
+        if segment_dir:
+            os.makedirs(segment_dir, exist_ok=True)
+            print("Re-encoding {} of {} chunks".format(len(jobs), len(chunks)))
+        if jobs:
+            workers = max(1, min(workers, len(jobs)))
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # spawn, since this process has other threads running and may hold a Whisper model,
+            # which forking is unsafe with; the workers only need ffmpeg and Pillow
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                list(executor.map(render_chunk, [job + (threads,) for job, _, _ in jobs.values()]))
+            for job, copies, _ in jobs.values():
+                for chunk_path in copies:
+                    link_or_copy(job[2], chunk_path)
+            increment("segments_encoded", len(jobs))
+            increment("frames_encoded", sum(frame_count for _, _, frame_count in jobs.values()))
+
+        concat_chunks(chunk_paths, audio_file_path, output_path, work_dir)
+        if segment_dir:
+            evict_lru(segment_dir, RENDER_SEGMENT_MAX_BYTES, keep=segment_paths)
+        return output_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -4,19 +4,17 @@ import tempfile
 import zipfile
 import platform
 import subprocess
-from moviepy.editor import (AudioFileClip, CompositeVideoClip, CompositeAudioClip, ImageClip,
-                            TextClip, VideoFileClip)
-from moviepy.audio.fx.audio_loop import audio_loop
-from moviepy.audio.fx.audio_normalize import audio_normalize
-import requests
+from utility.render.clip_cache import stream_to_file
+from utility.render.clip_downloader import download_clips
+from utility.render.caption_renderer import render_caption
+from utility.render.ffmpeg_backend import render_with_ffmpeg
+from utility.render.mezzanine import MEZZANINE_ENABLED, ingest_clips
+from utility.render.parallel_render import (RENDER_CHUNK_SECONDS, RENDER_SEGMENT_DIRECTORY, RENDER_WORKERS,
+                                            render_parallel)
+from utility.instrumentation import increment, instrumented
 
 def download_file(url, filename):
-    with open(filename, 'wb') as f:
-        headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers)
-        f.write(response.content)
+    stream_to_file(url, filename)
 
 def search_program(program_name):
     try: 
@@ -29,33 +27,76 @@ def get_program_path(program_name):
     program_path = search_program(program_name)
     return program_path
 
-def get_output_media(audio_file_path, timed_captions, background_video_data, video_server):
-    OUTPUT_FILE_NAME = "rendered_video.mp4"
+def configure_imagemagick():
     magick_path = get_program_path("magick")
     print(magick_path)
     if magick_path:
         os.environ['IMAGEMAGICK_BINARY'] = magick_path
     else:
         os.environ['IMAGEMAGICK_BINARY'] = '/usr/bin/convert'
-    
-    visual_clips = []
-    for (t1, t2), video_url in background_video_data:
-        # Download the video file
-        video_filename = tempfile.NamedTemporaryFile(delete=False).name
-        download_file(video_url, video_filename)
-        
-        # Create VideoFileClip from the downloaded file
-        video_clip = VideoFileClip(video_filename)
+
+def iter_background_clips(background_video_data, mezzanine=MEZZANINE_ENABLED):
+    # yields (index, path) as each segment's clip lands; segments without a url are skipped
+    if mezzanine:
+        yield from ingest_clips(background_video_data)
+        return
+    indexed_urls = [(index, video_url) for index, (_, video_url) in enumerate(background_video_data) if video_url]
+    for position, video_filename in download_clips([video_url for _, video_url in indexed_urls]):
+        yield indexed_urls[position][0], video_filename
+
+def download_background_segments(background_video_data, mezzanine=MEZZANINE_ENABLED):
+    # segments without a clip are left black
+    background_segments = [[interval, None] for interval, _ in background_video_data]
+    for index, video_filename in iter_background_clips(background_video_data, mezzanine):
+        background_segments[index][1] = video_filename
+    return background_segments
+
+@instrumented()
+def get_output_media(audio_file_path, timed_captions, background_video_data, video_server, caption_backend="pillow",
+                     backend="moviepy", render_workers=RENDER_WORKERS, chunk_seconds=RENDER_CHUNK_SECONDS,
+                     output_file_name="rendered_video.mp4", mezzanine=MEZZANINE_ENABLED):
+    OUTPUT_FILE_NAME = output_file_name
+    if backend == "ffmpeg":
+        background_segments = download_background_segments(background_video_data, mezzanine)
+        return render_with_ffmpeg(audio_file_path, timed_captions, background_segments, OUTPUT_FILE_NAME)
+    if backend in ("parallel", "incremental"):
+        # incremental keeps the encoded chunks and only re-encodes those whose inputs changed
+        background_segments = download_background_segments(background_video_data, mezzanine)
+        return render_parallel(audio_file_path, timed_captions, background_segments, OUTPUT_FILE_NAME,
+                               workers=render_workers, chunk_seconds=chunk_seconds,
+                               segment_dir=RENDER_SEGMENT_DIRECTORY if backend == "incremental" else None)
+
+    # moviepy is only loaded by renders that use it; the ffmpeg backends never import it
+    from moviepy.editor import AudioFileClip, CompositeVideoClip, CompositeAudioClip, ImageClip, TextClip
+    from utility.render.lazy_clips import MAX_OPEN_READERS, LazyVideoClip, ReaderPool
+
+    if caption_backend == "imagemagick":
+        configure_imagemagick()
+
+    # Download the video files in parallel through the on-disk clip cache; with mezzanine,
+    # each is also cut to its segment and conformed to 25 fps so MoviePy decodes only what it plays
+    background_clips = [None] * len(background_video_data)
+    reader_pool = ReaderPool(MAX_OPEN_READERS)
+    for index, video_filename in iter_background_clips(background_video_data, mezzanine):
+        (t1, t2), _ = background_video_data[index]
+
+        # Create the clip as soon as its file has landed; its decoder only runs between t1 and t2
+        video_clip = LazyVideoClip(video_filename, t1, t2, reader_pool)
         video_clip = video_clip.set_start(t1)
         video_clip = video_clip.set_end(t2)
-        visual_clips.append(video_clip)
+        background_clips[index] = video_clip
+    # segments without a clip are left out, so the composite shows black there
+    visual_clips = [clip for clip in background_clips if clip is not None]
     
     audio_clips = []
     audio_file_clip = AudioFileClip(audio_file_path)
     audio_clips.append(audio_file_clip)
 
     for (t1, t2), text in timed_captions:
-        text_clip = TextClip(txt=text, fontsize=100, color="white", stroke_width=3, stroke_color="black", method="label")
+        if caption_backend == "imagemagick":
+            text_clip = TextClip(txt=text, fontsize=100, color="white", stroke_width=3, stroke_color="black", method="label")
+        else:
+            text_clip = ImageClip(render_caption(text, fontsize=100, color="white", stroke_color="black", stroke_width=3))
         text_clip = text_clip.set_start(t1)
         text_clip = text_clip.set_end(t2)
         text_clip = text_clip.set_position(["center", 800])
@@ -68,11 +109,20 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
         video.duration = audio.duration
         video.audio = audio
 
-    video.write_videofile(OUTPUT_FILE_NAME, codec='libx264', audio_codec='aac', fps=25, preset='veryfast')
-    
-    # Clean up downloaded files
-    for (t1, t2), video_url in background_video_data:
-        video_filename = tempfile.NamedTemporaryFile(delete=False).name
-        os.remove(video_filename)
+    # moviepy would name its temporary audio track after the output basename in the current
+    # directory, which concurrent batch jobs all rendering rendered_video.mp4 would share
+    fd, temp_audio_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(OUTPUT_FILE_NAME)),
+                                           prefix="temp_audio_", suffix=".m4a")
+    os.close(fd)
+    try:
+        video.write_videofile(OUTPUT_FILE_NAME, codec='libx264', audio_codec='aac', fps=25, preset='veryfast',
+                              temp_audiofile=temp_audio_path, remove_temp=True)
+    finally:
+        reader_pool.close_all()
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+    increment("frames_encoded", int(video.duration * 25))
+    increment("clip_readers_opened", reader_pool.opened)
 
+    # Downloaded clips stay in the clip cache for reuse by later renders
     return OUTPUT_FILE_NAME
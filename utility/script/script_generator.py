@@ -1,18 +1,32 @@
 import os
-from openai import OpenAI
 import json
+import threading
+from utility.instrumentation import instrumented
+from utility.llm_cache import cached_chat_completion
 
-if len(os.environ.get("GROQ_API_KEY")) > 30:
-    from groq import Groq
-    model = "mistral-saba-24b"
-    client = Groq(
-        api_key=os.environ.get("GROQ_API_KEY"),
-        )
-else:
-    OPENAI_API_KEY = os.getenv('OPENAI_KEY')
-    model = "gpt-4o"
-    client = OpenAI(api_key=OPENAI_API_KEY)
+USE_GROQ = len(os.environ.get("GROQ_API_KEY") or "") > 30
+model = "mistral-saba-24b" if USE_GROQ else "gpt-4o"
 
+# built by get_client on first use, so importing this module never loads an SDK
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global client
+    with _client_lock:
+        if client is None:
+            if USE_GROQ:
+                from groq import Groq
+                client = Groq(
+                    api_key=os.environ.get("GROQ_API_KEY"),
+                    )
+            else:
+                from openai import OpenAI
+                OPENAI_API_KEY = os.getenv('OPENAI_KEY')
+                client = OpenAI(api_key=OPENAI_API_KEY)
+        return client
+
+@instrumented()
 def generate_script(topic):
     prompt = (
     """
@@ -44,22 +58,19 @@ Strictly output the script in a JSON format like below, and only provide a parsa
 )
 
 
-    response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": topic}
-            ]
-        )
-    content = response.choices[0].message.content
+    # an answer without a parsable script is not cached, so a retry asks the LLM again
+    content = cached_chat_completion(get_client, model, prompt, topic, validate=parse_script)
+    print("Content before parsing:", repr(content))
+    return parse_script(content)
+
+def parse_script(content):
+    content = content.replace("\\'", "'").replace("'", "\\\"")
     try:
-        content = content.replace("\\'", "'").replace("'", "\\\"")
-        print("Content before parsing:", repr(content))
         script = json.loads(content)["script"]
     except Exception as e:
+        # the JSON object may be wrapped in other text
         json_start_index = content.find('{')
         json_end_index = content.rfind('}')
-        print(content)
         content = content[json_start_index:json_end_index+1]
         script = json.loads(content)["script"]
     return script
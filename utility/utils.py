@@ -1,6 +1,14 @@
 import os
 from datetime import datetime
 import json
+import gzip
+import queue
+import atexit
+import stat
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
 
 # Log types
 LOG_TYPE_GPT = "GPT"
@@ -10,6 +18,114 @@ LOG_TYPE_PEXEL = "PEXEL"
 DIRECTORY_LOG_GPT = ".logs/gpt_logs"
 DIRECTORY_LOG_PEXEL = ".logs/pexel_logs"
 
+# entries are appended to <name>.jsonl in each directory, which is rotated once it reaches LOG_ROTATE_BYTES
+LOG_FILE_NAMES = {LOG_TYPE_GPT: "gpt3", LOG_TYPE_PEXEL: "pexel"}
+LOG_ROTATE_BYTES = int(os.environ.get("LOG_ROTATE_BYTES", 50 * 1024 ** 2))
+LOG_COMPRESS = os.environ.get("LOG_COMPRESS", "0") == "1"
+
+# entries waiting for the writer thread; when full, "drop" discards new entries and "block" waits for room
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 1000))
+LOG_QUEUE_POLICY = os.environ.get("LOG_QUEUE_POLICY", "drop")
+
+class BackgroundLogWriter:
+    """
+    Appends log entries to JSONL files from a background thread, so callers only pay for
+    a queue put. Files are rotated by size, rotated files are optionally gzipped, and
+    close() (registered with atexit) writes out everything still queued.
+    """
+
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, policy=LOG_QUEUE_POLICY, rotate_bytes=LOG_ROTATE_BYTES,
+                 compress=LOG_COMPRESS):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.policy = policy
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self.dropped = 0
+        self._files = {}
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, directory, name, entry):
+        # returns False if the entry was dropped because the queue is full
+        try:
+            self.queue.put((directory, name, entry), block=(self.policy == "block"))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                print("WARNING: log queue full, dropping log entries")
+            return False
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                self._write(*item)
+                # flush once the burst is written rather than after every entry
+                if self.queue.empty():
+                    for outfile in self._files.values():
+                        outfile.flush()
+            except Exception as e:
+                print("Could not write log entry: {}".format(e))
+            finally:
+                self.queue.task_done()
+        for outfile in self._files.values():
+            outfile.close()
+        self._files.clear()
+
+    def _write(self, directory, name, entry):
+        # serialized here rather than by the caller, which keeps json.dumps off the request path
+        line = json.dumps(entry) + '\n'
+        key = (directory, name)
+        outfile = self._files.get(key)
+        if outfile is None:
+            os.makedirs(directory, exist_ok=True)
+            outfile = self._files[key] = open(os.path.join(directory, name + ".jsonl"), "a", encoding="utf-8")
+        outfile.write(line)
+        if outfile.tell() >= self.rotate_bytes:
+            self._rotate(key)
+
+    def _rotate(self, key):
+        directory, name = key
+        self._files.pop(key).close()
+        path = os.path.join(directory, name + ".jsonl")
+        rotated = os.path.join(directory, "{}_{}.jsonl".format(name, datetime.now().strftime("%Y%m%d_%H%M%S_%f")))
+        os.replace(path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+def get_log_writer():
+    # started on the first logged entry, so importing this module never starts a thread
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = BackgroundLogWriter()
+            atexit.register(_log_writer.close)
+        return _log_writer
+
+def _reset_log_writer():
+    # a forked child has the parent's queue but not its thread, so it starts a writer of its own
+    global _log_writer, _log_writer_lock
+    _log_writer = None
+    _log_writer_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_log_writer)
+
 # method to log response from pexel and openai
 def log_response(log_type, query,response):
     log_entry = {
@@ -18,17 +134,83 @@ def log_response(log_type, query,response):
         "timestamp": datetime.now().isoformat()
     }
     if log_type == LOG_TYPE_GPT:
-        if not os.path.exists(DIRECTORY_LOG_GPT):
-            os.makedirs(DIRECTORY_LOG_GPT)
-        filename = '{}_gpt3.txt'.format(datetime.now().strftime("%Y%m%d_%H%M%S"))
-        filepath = os.path.join(DIRECTORY_LOG_GPT, filename)
-        with open(filepath, "w") as outfile:
-            outfile.write(json.dumps(log_entry) + '\n')
+        get_log_writer().submit(DIRECTORY_LOG_GPT, LOG_FILE_NAMES[LOG_TYPE_GPT], log_entry)
 
     if log_type == LOG_TYPE_PEXEL:
-        if not os.path.exists(DIRECTORY_LOG_PEXEL):
-            os.makedirs(DIRECTORY_LOG_PEXEL)
-        filename = '{}_pexel.txt'.format(datetime.now().strftime("%Y%m%d_%H%M%S"))
-        filepath = os.path.join(DIRECTORY_LOG_PEXEL, filename)
-        with open(filepath, "w") as outfile:
-            outfile.write(json.dumps(log_entry) + '\n')
+        get_log_writer().submit(DIRECTORY_LOG_PEXEL, LOG_FILE_NAMES[LOG_TYPE_PEXEL], log_entry)
+
+@contextmanager
+def atomic_file(path, mode="wb"):
+    """
+    Opens a temporary file next to path and renames it over path once the block completes,
+    so readers never see a partial file. The temporary file is removed if the block fails.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, part_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+# method to write bytes or text to path in one step, through atomic_file
+def atomic_write(path, data):
+    with atomic_file(path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+
+# method to trim a cache directory down to max_bytes, removing least recently used files first
+def evict_lru(directory, max_bytes, keep=()):
+    if not os.path.isdir(directory):
+        return 0
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        if name.endswith(".part"):
+            continue
+        path = os.path.join(directory, name)
+        # another process may evict the same directory, so files can vanish at any point
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(info.st_mode):
+            continue
+        entries.append((info.st_mtime, info.st_size, path))
+        total += info.st_size
+
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # already evicted by someone else, which frees the space all the same
+            total -= size
+            continue
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+# method to build a requests session with a sized connection pool and retries with exponential backoff
+def create_pooled_session(pool_size, retries=4, backoff_factor=1.0):
+    # imported here so modules that only log or evict do not pay for loading requests
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
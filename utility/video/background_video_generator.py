@@ -1,12 +1,64 @@
-import os 
-import requests
-from utility.utils import log_response,LOG_TYPE_PEXEL
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utility.utils import log_response, create_pooled_session, atomic_write, evict_lru, LOG_TYPE_PEXEL
+from utility.video.library_index import LIBRARY_INDEX_ENABLED, index_search_response, lookup
+from utility.instrumentation import bind_context, increment, instrumented
 
 PEXELS_API_KEY = os.environ.get('PEXELS_KEY')
+PEXELS_API_URL = os.environ.get('PEXELS_API_URL', "https://api.pexels.com/videos/search")
+
+# number of Pexels searches in flight at the same time
+SEARCH_WORKERS = int(os.environ.get("PEXELS_SEARCH_WORKERS", 4))
+
+# search responses are reused for this many seconds before asking Pexels again
+SEARCH_CACHE_DIRECTORY = os.environ.get("PEXELS_CACHE_DIR", ".cache/pexels")
+SEARCH_CACHE_TTL = int(os.environ.get("PEXELS_CACHE_TTL", 24 * 60 * 60))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("PEXELS_CACHE_MAX_BYTES", 100 * 1024 ** 2))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_pooled_session(SEARCH_WORKERS)
+        return _session
+
+def _search_cache_path(query_string, orientation_landscape):
+    key = json.dumps([query_string.strip().lower(), orientation_landscape])
+    return os.path.join(SEARCH_CACHE_DIRECTORY, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+def _read_search_cache(path):
+    # hits keep their mtime, so the TTL runs from the time Pexels answered; expired entries are removed
+    try:
+        if time.time() - os.path.getmtime(path) > SEARCH_CACHE_TTL:
+            os.remove(path)
+            return None
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_search_cache(path, json_data):
+    atomic_write(path, json.dumps(json_data))
+    evict_lru(SEARCH_CACHE_DIRECTORY, SEARCH_CACHE_MAX_BYTES, keep=(path,))
 
 def search_videos(query_string, orientation_landscape=True):
-   
-    url = "https://api.pexels.com/videos/search"
+
+    cache_path = _search_cache_path(query_string, orientation_landscape)
+    json_data = _read_search_cache(cache_path)
+    if json_data is not None:
+        increment("pexels_cache_hits")
+        return json_data
+    increment("pexels_requests")
+
+    url = PEXELS_API_URL
     headers = {
         "Authorization": PEXELS_API_KEY,
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
@@ -17,16 +69,22 @@ def search_videos(query_string, orientation_landscape=True):
         "per_page": 15
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params, timeout=30)
     json_data = response.json()
-    log_response(LOG_TYPE_PEXEL,query_string,response.json())
-   
+    log_response(LOG_TYPE_PEXEL,query_string,json_data)
+    if response.ok and 'videos' in json_data:
+        _write_search_cache(cache_path, json_data)
+        if LIBRARY_INDEX_ENABLED:
+            try:
+                index_search_response(query_string, json_data)
+            except sqlite3.Error as e:
+                print("Could not add the results for {} to the library index: {}".format(query_string, e))
+
     return json_data
 
 
-def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
-    vids = search_videos(query_string, orientation_landscape)
-    videos = vids['videos']  # Extract the videos list from JSON
+def selectBestVideo(vids, orientation_landscape=True, used_vids=[]):
+    videos = vids.get('videos', [])  # Extract the videos list from JSON
 
     # Filter and extract videos with width and height as 1920x1080 for landscape or 1080x1920 for portrait
     if orientation_landscape:
@@ -48,23 +106,69 @@ def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
                 if video_file['width'] == 1080 and video_file['height'] == 1920:
                     if not (video_file['link'].split('.hd')[0] in used_vids):
                         return video_file['link']
-    print("NO LINKS found for this round of search with query :", query_string)
     return None
 
 
-def generate_video_url(timed_video_searches,video_server):
+def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
+    vids = search_videos(query_string, orientation_landscape)
+    link = selectBestVideo(vids, orientation_landscape, used_vids)
+    if link is None:
+        print("NO LINKS found for this round of search with query :", query_string)
+    return link
+
+
+@instrumented()
+def generate_video_url(timed_video_searches,video_server, on_resolved=None):
+        # on_resolved(index, [t1, t2], url) is called as soon as each segment's clip is chosen
         timed_video_urls = []
         if video_server == "pexel":
-            used_links = []
-            for (t1, t2), search_terms in timed_video_searches:
-                url = ""
-                for query in search_terms:
-                  
-                    url = getBestVideo(query, orientation_landscape=True, used_vids=used_links)
-                    if url:
-                        used_links.append(url.split('.hd')[0])
-                        break
-                timed_video_urls.append([[t1, t2], url])
+            with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+                searches = {}
+                library = {}
+
+                def library_search(query):
+                    # videos already seen in earlier Pexels responses, looked up once per query
+                    if query not in library:
+                        try:
+                            library[query] = lookup(query) if LIBRARY_INDEX_ENABLED else {"videos": []}
+                        except sqlite3.Error as e:
+                            print("Library index lookup failed for {}: {}".format(query, e))
+                            library[query] = {"videos": []}
+                    return library[query]
+
+                def search(query):
+                    # one request per distinct query, shared by every segment that asks for it
+                    if query not in searches:
+                        searches[query] = executor.submit(bind_context(search_videos), query, True)
+                    return searches[query]
+
+                # Start the primary search of every segment the library cannot answer up front;
+                # fallbacks are only fetched when a segment actually needs them
+                segments = []
+                for (t1, t2), search_terms in timed_video_searches:
+                    if search_terms and not selectBestVideo(library_search(search_terms[0])):
+                        search(search_terms[0])
+                    segments.append(((t1, t2), search_terms))
+
+                # Pick clips in segment order so used_links de-duplication stays deterministic
+                used_links = []
+                for (t1, t2), search_terms in segments:
+                    url = ""
+                    for query in search_terms:
+
+                        url = selectBestVideo(library_search(query), orientation_landscape=True, used_vids=used_links)
+                        if url:
+                            increment("library_hits")
+                        else:
+                            increment("library_misses")
+                            url = selectBestVideo(search(query).result(), orientation_landscape=True, used_vids=used_links)
+                        if url:
+                            used_links.append(url.split('.hd')[0])
+                            break
+                        print("NO LINKS found for this round of search with query :", query)
+                    timed_video_urls.append([[t1, t2], url])
+                    if on_resolved:
+                        on_resolved(len(timed_video_urls) - 1, [t1, t2], url)
         elif video_server == "stable_diffusion":
             timed_video_urls = get_images_for_video(timed_video_searches)
 
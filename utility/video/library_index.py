@@ -0,0 +1,143 @@
+import os
+import re
+import gzip
+import json
+import sqlite3
+import argparse
+from contextlib import closing
+from utility.utils import DIRECTORY_LOG_PEXEL
+from utility.render.clip_cache import CLIP_CACHE_DIRECTORY, cached_clip_path
+
+# every Pexels video seen in a search response, with an inverted keyword index over it
+LIBRARY_INDEX_PATH = os.environ.get("LIBRARY_INDEX_PATH", ".cache/library.sqlite")
+LIBRARY_INDEX_ENABLED = os.environ.get("LIBRARY_INDEX", "1") != "0"
+
+STOPWORDS = {"a", "an", "and", "at", "by", "for", "from", "in", "into", "of", "on", "or", "the", "to", "with"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    duration INTEGER,
+    width INTEGER,
+    height INTEGER,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keywords (
+    keyword TEXT NOT NULL,
+    video_id INTEGER NOT NULL,
+    PRIMARY KEY (keyword, video_id)
+) WITHOUT ROWID;
+"""
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS and not word.isdigit()]
+
+def video_keywords(video, query=None):
+    # the query that found the video, its tags and the words of its page slug, e.g. /video/man-surfing-a-wave-1234/
+    keywords = set(tokenize(query or ""))
+    for tag in video.get("tags") or []:
+        keywords.update(tokenize(tag if isinstance(tag, str) else tag.get("name", "")))
+    slug = (video.get("url") or "").rstrip("/").rsplit("/", 1)[-1]
+    keywords.update(tokenize(slug))
+    return keywords
+
+def connect(path=LIBRARY_INDEX_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    # WAL lets batch jobs read the index while another job is adding to it
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+def index_search_response(query, json_data, path=LIBRARY_INDEX_PATH):
+    """
+    Adds the videos of a Pexels search response to the library, indexed under the query
+    words as well as their own tags and slug. Returns the number of videos added or updated.
+    """
+    videos = [video for video in json_data.get("videos", []) if "id" in video and video.get("video_files")]
+    if not videos:
+        return 0
+    with closing(connect(path)) as connection, connection:
+        for video in videos:
+            connection.execute("INSERT OR REPLACE INTO videos (id, duration, width, height, data) VALUES (?, ?, ?, ?, ?)",
+                               (video["id"], video.get("duration"), video.get("width"), video.get("height"),
+                                json.dumps(video)))
+            connection.executemany("INSERT OR IGNORE INTO keywords (keyword, video_id) VALUES (?, ?)",
+                                   [(keyword, video["id"]) for keyword in video_keywords(video, query)])
+    return len(videos)
+
+def is_downloaded(video, cache_dir=CLIP_CACHE_DIRECTORY):
+    return any(os.path.exists(cached_clip_path(video_file["link"], cache_dir))
+               for video_file in video.get("video_files", []) if video_file.get("link"))
+
+def lookup(query, path=LIBRARY_INDEX_PATH, cache_dir=CLIP_CACHE_DIRECTORY):
+    """
+    Returns the library videos matching every word of query as a search-response shaped
+    dict, so selectBestVideo applies the same rules as for live results. Videos whose clip
+    is already in the clip cache come first.
+    """
+    words = sorted(set(tokenize(query)))
+    if not words or not os.path.exists(path):
+        return {"videos": []}
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT v.data FROM keywords k JOIN videos v ON v.id = k.video_id "
+            "WHERE k.keyword IN ({}) GROUP BY k.video_id HAVING COUNT(*) = ? ORDER BY k.video_id".format(
+                ",".join("?" * len(words))), words + [len(words)]).fetchall()
+    videos = [json.loads(data) for data, in rows]
+    videos.sort(key=lambda video: not is_downloaded(video, cache_dir))
+    return {"videos": videos}
+
+def read_pexel_logs(log_dir=DIRECTORY_LOG_PEXEL):
+    """
+    Yields (query, response) from logged Pexels calls: the JSONL log, its rotated (and
+    possibly gzipped) predecessors and the one-entry .txt files of older versions.
+    """
+    if not os.path.isdir(log_dir):
+        return
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        if name.endswith(".gz"):
+            opener = gzip.open
+        elif name.endswith((".jsonl", ".txt")):
+            opener = open
+        else:
+            continue
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get("response"), dict):
+                    yield entry.get("query"), entry["response"]
+
+def rebuild_index(log_dir=DIRECTORY_LOG_PEXEL, search_cache_dir=None, path=LIBRARY_INDEX_PATH):
+    """
+    Fills the library from the Pexels response logs and, if given, the search response
+    cache (whose entries carry no query, so only tags and slugs are indexed).
+    """
+    count = 0
+    for query, response in read_pexel_logs(log_dir):
+        count += index_search_response(query, response, path)
+    if search_cache_dir and os.path.isdir(search_cache_dir):
+        for name in sorted(os.listdir(search_cache_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(search_cache_dir, name)) as f:
+                    count += index_search_response(None, json.load(f), path)
+            except (OSError, ValueError):
+                continue
+    return count
+
+if __name__ == "__main__":
+    from utility.video.background_video_generator import SEARCH_CACHE_DIRECTORY
+
+    parser = argparse.ArgumentParser(description="Build the local stock footage library from logged Pexels responses.")
+    parser.add_argument("--log-dir", default=DIRECTORY_LOG_PEXEL)
+    parser.add_argument("--search-cache-dir", default=SEARCH_CACHE_DIRECTORY)
+    parser.add_argument("--index", default=LIBRARY_INDEX_PATH)
+    args = parser.parse_args()
+
+    print("Indexed {} videos into {}".format(rebuild_index(args.log_dir, args.search_cache_dir, args.index), args.index))
@@ -1,20 +1,34 @@
 import os
 import json
 import re
+import threading
 from datetime import datetime
 from utility.utils import log_response, LOG_TYPE_GPT
+from utility.instrumentation import instrumented
+from utility.llm_cache import cached_chat_completion, stream_chat_completion
 
 # Determine which LLM client and model to use based on environment variables
-if os.environ.get("GROQ_API_KEY") and len(os.environ.get("GROQ_API_KEY")) > 30:
-    from groq import Groq
-    model = "llama3-70b-8192"
-    client = Groq(
-        api_key=os.environ.get("GROQ_API_KEY"),
-    )
-else:
-    model = "gpt-4o"
-    OPENAI_API_KEY = os.environ.get('OPENAI_KEY')
-    client = OpenAI(api_key=OPENAI_API_KEY)
+USE_GROQ = len(os.environ.get("GROQ_API_KEY") or "") > 30
+model = "llama3-70b-8192" if USE_GROQ else "gpt-4o"
+
+# built by get_client on first use, so importing this module never loads an SDK
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global client
+    with _client_lock:
+        if client is None:
+            if USE_GROQ:
+                from groq import Groq
+                client = Groq(
+                    api_key=os.environ.get("GROQ_API_KEY"),
+                )
+            else:
+                from openai import OpenAI
+                OPENAI_API_KEY = os.environ.get('OPENAI_KEY')
+                client = OpenAI(api_key=OPENAI_API_KEY)
+        return client
 
 log_directory = ".logs/gpt_logs"
 
@@ -64,6 +78,7 @@ def fix_json(json_str):
 
     return json_str
 
+@instrumented()
 def getVideoSearchQueriesTimed(script, captions_timed):
     """
     Generates timed video search queries by calling an LLM.
@@ -84,16 +99,11 @@ def getVideoSearchQueriesTimed(script, captions_timed):
             print("Content before fixing: \n", content_raw, "\n\n")
             print(f"Error details: {e}")
             content_fixed = fix_json(content_raw.replace("```json", "").replace("```", ""))
-            i=input()
-            out = json.loads(i)
-            #out = json.loads(content_fixed) # Attempt to parse the fixed content
+            out = json.loads(content_fixed) # Attempt to parse the fixed content
 
         # Basic validation: ensure the parsed 'out' is a list and contains the expected structure
         # This helps catch cases where the LLM might return an unexpected format
-        if not isinstance(out, list) or \
-           not all(isinstance(item, list) and len(item) == 2 and \
-                   isinstance(item[0], list) and len(item[0]) == 2 and \
-                   isinstance(item[1], list) for item in out):
+        if not isinstance(out, list) or not all(isTimedSegment(item) for item in out):
             print("WARNING: Parsed JSON does not match expected structure. Returning empty list.")
             return []
 
@@ -105,26 +115,140 @@ def getVideoSearchQueriesTimed(script, captions_timed):
         # Crucially, always return an empty list on error to prevent 'NoneType' issues downstream.
         return []
 
+def isTimedSegment(item):
+    # one [[t1, t2], ["keyword1", ...]] entry of the LLM's answer
+    return isinstance(item, list) and len(item) == 2 and \
+           isinstance(item[0], list) and len(item[0]) == 2 and \
+           isinstance(item[1], list)
+
+def parseTimedSegments(content):
+    """
+    Parses a complete answer the way getVideoSearchQueriesTimed does and returns the
+    segments, raising ValueError when the answer would be rejected. Used to keep unusable
+    answers out of the LLM cache.
+    """
+    try:
+        out = json.loads(content)
+    except json.JSONDecodeError:
+        out = json.loads(fix_json(content.replace("```json", "").replace("```", "")))
+    if not isinstance(out, list) or not out or not all(isTimedSegment(item) for item in out):
+        raise ValueError("not a list of timed segments")
+    return out
+
+def cleanResponse(content):
+    # collapse the answer onto one line, as it is logged and parsed
+    return re.sub(r'\s+', ' ', content.strip())
+
+def iterTimedSegments(text_chunks):
+    """
+    Parses the timed keyword array incrementally from streamed text, yielding (position,
+    element) for each [[t1, t2], [...]] element as soon as its closing bracket arrives.
+    Unparsable elements are yielded as None, so positions always match the array. Anything
+    before the opening bracket of the array (such as a ```json fence) is skipped.
+    """
+    depth = 0
+    position = 0
+    in_string = False
+    escaped = False
+    element = []
+    for chunk in text_chunks:
+        for char in chunk:
+            if depth >= 2:
+                element.append(char)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                continue
+            if char == '"':
+                in_string = True
+            elif char == '[':
+                depth += 1
+                if depth == 2:
+                    element = ['[']
+            elif char == ']':
+                depth -= 1
+                if depth == 1:
+                    element_text = "".join(element)
+                    try:
+                        item = json.loads(element_text)
+                    except json.JSONDecodeError:
+                        try:
+                            item = json.loads(fix_json(element_text))
+                        except json.JSONDecodeError:
+                            print("WARNING: Skipping unparsable segment:", element_text)
+                            item = None
+                    yield position, item
+                    position += 1
+                elif depth == 0:
+                    return
+
+def streamVideoSearchQueriesTimed(script, captions_timed):
+    """
+    Streaming counterpart of getVideoSearchQueriesTimed: yields each timed segment as soon
+    as the LLM has finished writing it, so clip search can start before the full answer is in.
+    Malformed entries are skipped.
+    """
+    user_content = getUserContent(script, captions_timed)
+    print("Content being sent to LLM:", user_content)
+    pieces = []
+    recorded_rest = recorded(stream_chat_completion(get_client, model, prompt, user_content, temperature=1,
+                                                    validate=parseTimedSegments), pieces)
+
+    # array positions already yielded; skipped elements leave gaps the whole-text pass may fill
+    yielded = set()
+    for position, item in iterTimedSegments(recorded_rest):
+        if isTimedSegment(item):
+            yielded.add(position)
+            yield item
+        elif item is not None:
+            print("WARNING: Skipping malformed segment:", item)
+
+    # drain the stream, then let the whole-text repairs recover anything the incremental parser could not
+    for _ in recorded_rest:
+        pass
+    text = "".join(pieces)
+    log_response(LOG_TYPE_GPT, script, text)
+    text = text.replace("```json", "").replace("```", "")
+    try:
+        out = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            out = json.loads(fix_json(text))
+        except json.JSONDecodeError:
+            return
+    if isinstance(out, list):
+        for position, item in enumerate(out):
+            if position not in yielded and isTimedSegment(item):
+                yield item
+
+def recorded(chunks, pieces):
+    # passes streamed chunks through while keeping a copy of the full text
+    for chunk in chunks:
+        pieces.append(chunk)
+        yield chunk
+
+def getUserContent(script, captions_timed):
+    # Format the user content for the LLM
+    return f"Script: {script}\nTimed Captions:{''.join(map(str, captions_timed))}"
+
 def call_OpenAI(script, captions_timed):
     """
     Makes a request to the configured LLM (OpenAI or Groq) to get video search queries.
     """
-    # Format the user content for the LLM
-    user_content = f"Script: {script}\nTimed Captions:{''.join(map(str, captions_timed))}"
+    user_content = getUserContent(script, captions_timed)
     print("Content being sent to LLM:", user_content)
 
-    response = client.chat.completions.create(
-        model=model,
-        temperature=1, # Controls randomness; 1 is typical, higher for more creativity
-        messages=[
-            {"role": "system", "content": prompt}, # System role for instructions
-            {"role": "user", "content": user_content} # User role for the specific request
-        ]
-    )
+    # temperature 1 is typical for this prompt; repeated requests are served from the LLM cache,
+    # which only keeps answers that parse into timed segments
+    content = cached_chat_completion(get_client, model, prompt, user_content, temperature=1,
+                                     validate=lambda content: parseTimedSegments(cleanResponse(content)))
 
     # Extract and clean the LLM's response
-    text = response.choices[0].message.content.strip()
-    text = re.sub(r'\s+', ' ', text) # Replace multiple spaces with a single space
+    text = cleanResponse(content)
     print("Text response from LLM:", text)
     log_response(LOG_TYPE_GPT, script, text) # Log the response for debugging/monitoring
     return text